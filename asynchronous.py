@@ -0,0 +1,278 @@
+""" CS5001-5003, Spring 2022
+    Final Project (asynchronous module)
+    Norrec Nieh
+"""
+
+import Keygen
+import encrypt
+import decrypt
+import keyring
+import asyncio
+import concurrent.futures
+import os
+
+DEFAULT_CONCURRENCY = 8  # requests running at once per AsyncCrypto
+PARTIAL_SUFFIX = ".partial"  # outputs are renamed into place when complete
+
+
+class AsyncCrypto:
+    """ Class: AsyncCrypto
+        Attributes: __executor (ProcessPoolExecutor, shared by every
+                                request)
+                    __owns_executor (bool) (True if close shuts it down)
+                    __semaphore (asyncio.Semaphore) (concurrency limit)
+        Notes: asyncio front end to Keygen, encrypt and decrypt. Key
+               generation and exponentiation run in the process pool, and
+               key and ciphertext files are read and written either in the
+               pool or on the event loop's default thread pool, so the
+               event loop is never blocked.
+               At most max_concurrency requests run at once; the rest wait
+               their turn without holding a worker. A cancelled request
+               that has not started is dropped from the pool. One already
+               running in a worker finishes there, but its result is
+               discarded, and its output file is only renamed into place
+               once complete, so no partial file is left behind.
+    """
+
+    def __init__(self, max_concurrency=DEFAULT_CONCURRENCY, workers=None,
+                 executor=None):
+        """ Method: __init__ (constructor)
+            Parameters: max_concurrency (int)
+                        workers         (int) (processes in the pool,
+                                               defaults to the number of
+                                               cores)
+                        executor        (concurrent.futures.Executor, or
+                                         None to create a process pool)
+            Returns: None
+        """
+        self.__owns_executor = executor is None
+        if executor is None:
+            executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=workers)
+        self.__executor = executor
+        self.__semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def generate_key(self, key_size, prime_count=2):
+        """ AsyncCrypto Method: generate_key (public, coroutine)
+            Parameters: key_size    (int)
+                        prime_count (int) (primes in the key)
+            Returns: a new RSAKey, not exported
+            Notes: The primes are searched for concurrently in the pool, as
+                   in KeyPool. Cancelling stops whichever searches have not
+                   started yet.
+        """
+        sizes = Keygen.RSAKey.prime_sizes(key_size, prime_count)
+        async with self.__semaphore:
+            primes = await asyncio.gather(
+                *[self.__run(Keygen.RSAKey.generate_prime, key_size,
+                             prime_bits, prime_count)
+                  for prime_bits in sizes])
+            for index in range(1, len(primes)):
+                while primes[index] in primes[:index]:
+                    primes[index] = await self.__run(
+                        Keygen.RSAKey.generate_prime, key_size,
+                        sizes[index], prime_count)
+        return Keygen.RSAKey(key_size, primes=tuple(primes), export=False)
+
+    async def export_keys(self, key, public_key_path=Keygen.PUBLIC_KEY_PATH,
+                          private_key_path=Keygen.PRIVATE_KEY_PATH,
+                          binary=False):
+        """ AsyncCrypto Method: export_keys (public, coroutine)
+            Parameters: key              (RSAKey)
+                        public_key_path  (str)
+                        private_key_path (str)
+                        binary           (bool)
+            Returns: None
+            Notes: Writes the key files on the default thread pool.
+        """
+        await asyncio.get_running_loop().run_in_executor(
+            None, key.export_keys, public_key_path, private_key_path, binary)
+
+    async def load_public_key(self, path=Keygen.PUBLIC_KEY_PATH):
+        """ AsyncCrypto Method: load_public_key (public, coroutine)
+            Parameter: path (str)
+            Returns: n, e (ints)
+            Notes: Reads through keyring.DEFAULT_KEYRING on the default
+                   thread pool. Raises OSError or ValueError if the file
+                   cannot be read or parsed.
+        """
+        entry = await asyncio.get_running_loop().run_in_executor(
+            None, keyring.DEFAULT_KEYRING.load_public_key, path)
+        return entry["n"], entry["e"]
+
+    async def load_private_key(self, path=Keygen.PRIVATE_KEY_PATH,
+                               public_key_path=Keygen.PUBLIC_KEY_PATH):
+        """ AsyncCrypto Method: load_private_key (public, coroutine)
+            Parameters: path            (str)
+                        public_key_path (str)
+            Returns: n (int), private_key (dict)
+            Notes: As load_public_key, for the private key.
+        """
+        entry = await asyncio.get_running_loop().run_in_executor(
+            None, keyring.DEFAULT_KEYRING.load_private_key, path,
+            public_key_path)
+        return entry["n"], entry["private_key"]
+
+    async def encrypt_file(self, in_path, out_path=encrypt.CIPHERTEXT_PATH,
+                           public_key=Keygen.PUBLIC_KEY_PATH,
+                           mode=encrypt.MODE_BLOCK):
+        """ AsyncCrypto Method: encrypt_file (public, coroutine)
+            Parameters: in_path    (str)
+                        out_path   (str)
+                        public_key (as for encrypt.encrypt, but not None)
+                        mode       (str) (encrypt.MODE_BLOCK or
+                                          encrypt.MODE_HYBRID)
+            Returns: True/False (bool)
+            Notes: A key file is parsed here, through the keyring, so the
+                   workers receive n and e rather than parsing it again.
+        """
+        if isinstance(public_key, str):
+            try:
+                public_key = await self.load_public_key(public_key)
+            except (OSError, ValueError):
+                print("Error occurred while reading ", public_key, ".",
+                      sep="")
+                return False
+        else:
+            public_key = encrypt.resolve_public_key(public_key)
+        async with self.__semaphore:
+            return await self.__run(_encrypt_file, in_path, out_path,
+                                    public_key, mode)
+
+    async def decrypt_file(self, in_path, out_path=decrypt.DECRYPTED_PATH,
+                           public_key_path=Keygen.PUBLIC_KEY_PATH,
+                           private_key_path=Keygen.PRIVATE_KEY_PATH):
+        """ AsyncCrypto Method: decrypt_file (public, coroutine)
+            Parameters: in_path          (str)
+                        out_path         (str)
+                        public_key_path  (str)
+                        private_key_path (str)
+            Returns: True/False (bool)
+            Notes: Each worker caches the key pair in its own keyring.
+        """
+        async with self.__semaphore:
+            return await self.__run(_decrypt_file, in_path, out_path,
+                                    public_key_path, private_key_path)
+
+    async def encrypt_ints(self, values, n, e):
+        """ AsyncCrypto Method: encrypt_ints (public, coroutine)
+            Parameters: values (list of ints) (each smaller than n)
+                        n, e   (ints)
+            Returns: ciphertexts (list of ints)
+        """
+        async with self.__semaphore:
+            return await self.__run(_encrypt_ints, values, n, e)
+
+    async def decrypt_ints(self, ciphertexts, n, private_key):
+        """ AsyncCrypto Method: decrypt_ints (public, coroutine)
+            Parameters: ciphertexts (list of ints)
+                        n           (int)
+                        private_key (dict, as returned by load_private_key)
+            Returns: plaintexts (list of ints)
+        """
+        async with self.__semaphore:
+            return await self.__run(_decrypt_ints, ciphertexts, n,
+                                    private_key)
+
+    async def close(self):
+        """ AsyncCrypto Method: close (public, coroutine)
+            Parameters: None
+            Returns: None
+            Notes: Shuts down the process pool if it was created by this
+                   object, cancelling requests that have not started.
+        """
+        if self.__owns_executor:
+            await asyncio.get_running_loop().run_in_executor(
+                None, lambda: self.__executor.shutdown(
+                    wait=True, cancel_futures=True))
+
+    async def __run(self, function, *args):
+        """ AsyncCrypto Method: __run (private, coroutine)
+            Parameters: function (picklable function)
+                        args     (picklable arguments)
+            Returns: function(*args), computed in the pool
+            Notes: Cancelling the awaiting task cancels the pool's future,
+                   which drops the call if it has not started.
+        """
+        return await asyncio.get_running_loop().run_in_executor(
+            self.__executor, function, *args)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+
+def _encrypt_file(in_path, out_path, public_key, mode):
+    """ Function: _encrypt_file (private)
+        Parameters: in_path, out_path (str)
+                    public_key        ((n, e) tuple)
+                    mode              (str)
+        Returns: True/False (bool)
+        Notes: Runs in a worker process.
+    """
+    partial_path = out_path + PARTIAL_SUFFIX
+    try:
+        with open(in_path) as file_handle:
+            success = encrypt.encrypt(file_handle, out_path=partial_path,
+                                      mode=mode, public_key=public_key)
+    except OSError:
+        print("Error occurred while reading ", in_path, ".", sep="")
+        success = False
+    return _finish_output(partial_path, out_path, success)
+
+
+def _decrypt_file(in_path, out_path, public_key_path, private_key_path):
+    """ Function: _decrypt_file (private)
+        Parameters: in_path, out_path                 (str)
+                    public_key_path, private_key_path (str)
+        Returns: True/False (bool)
+        Notes: Runs in a worker process.
+    """
+    partial_path = out_path + PARTIAL_SUFFIX
+    try:
+        with open(in_path) as file_handle:
+            success = decrypt.decrypt(file_handle, partial_path,
+                                      public_key_path=public_key_path,
+                                      private_key_path=private_key_path)
+    except OSError:
+        print("Error occurred while reading ", in_path, ".", sep="")
+        success = False
+    return _finish_output(partial_path, out_path, success)
+
+
+def _finish_output(partial_path, out_path, success):
+    """ Function: _finish_output (private)
+        Parameters: partial_path (str) (file written by the request)
+                    out_path     (str)
+                    success      (bool)
+        Returns: success (bool)
+        Notes: Renames a complete output into place, or removes a partial
+               one, so out_path never holds a half-written file.
+    """
+    if success:
+        os.replace(partial_path, out_path)
+    elif os.path.exists(partial_path):
+        os.remove(partial_path)
+    return success
+
+
+def _encrypt_ints(values, n, e):
+    """ Function: _encrypt_ints (private)
+        Parameters: values (list of ints)
+                    n, e   (ints)
+        Returns: ciphertexts (list of ints)
+    """
+    return [Keygen.RSAKey.exp_mod(value, e, n) for value in values]
+
+
+def _decrypt_ints(ciphertexts, n, private_key):
+    """ Function: _decrypt_ints (private)
+        Parameters: ciphertexts (list of ints)
+                    n           (int)
+                    private_key (dict)
+        Returns: plaintexts (list of ints)
+    """
+    decryptor = decrypt.make_decryptor(n, private_key)
+    return [decryptor(ciphertext) for ciphertext in ciphertexts]
@@ -0,0 +1,216 @@
+""" CS5001-5003, Spring 2022
+    Final Project (backends module)
+    Norrec Nieh
+"""
+
+import Keygen
+import secrets
+
+try:
+    import gmpy2
+except ImportError:  # optional; the builtin backend is used without it.
+    gmpy2 = None
+
+BACKEND_PURE = "pure"  # RSAKey's own arithmetic, written out in Python
+BACKEND_BUILTIN = "builtin"  # Python's pow
+BACKEND_GMPY2 = "gmpy2"  # GMP through gmpy2, when installed
+
+
+class PureBackend:
+    """ Class: PureBackend
+        Attributes: name (str)
+        Notes: Exponentiation by RSAKey.exp_mod_iter and inverses by the
+               extended Euclidean algorithm. Primes are found by RSAKey's
+               sieve and Baillie-PSW test, with the Miller-Rabin rounds
+               also on exp_mod_iter, so no step reaches Python's pow.
+    """
+    name = BACKEND_PURE
+
+    @staticmethod
+    def exp_mod(x, y, n):
+        """ PureBackend Method: exp_mod (public, static)
+            Parameters: x: base     (int)
+                        y: exponent (int)
+                        n: modulus  (int)
+            Returns: x^y mod n      (int)
+        """
+        return Keygen.RSAKey.exp_mod_iter(x, y, n)
+
+    @staticmethod
+    def inverse(a, n):
+        """ PureBackend Method: inverse (public, static)
+            Parameters: a (int)
+                        n: modulus (int)
+            Returns: a^-1 mod n (int)
+            Notes: Raises ValueError if a has no inverse mod n.
+        """
+        return Keygen.RSAKey.mod_inverse(a, n)
+
+    @staticmethod
+    def is_prime(candidate, num_of_tests):
+        """ PureBackend Method: is_prime (public, static)
+            Parameters: candidate    (int)
+                        num_of_tests (int) (random-base Miller-Rabin rounds)
+            Returns: True/False (bool)
+        """
+        return Keygen.RSAKey.is_prime(candidate, num_of_tests,
+                                      Keygen.RSAKey.exp_mod_iter)
+
+    @staticmethod
+    def random_prime(floor, ceiling, num_of_tests):
+        """ PureBackend Method: random_prime (public, static)
+            Parameters: floor, ceiling (ints) (floor is odd)
+                        num_of_tests   (int)
+            Returns: a random prime between floor and ceiling (int)
+        """
+        return Keygen.RSAKey.search_prime(floor, ceiling, num_of_tests,
+                                          exp_mod=Keygen.RSAKey.exp_mod_iter)
+
+
+class BuiltinBackend(PureBackend):
+    """ Class: BuiltinBackend
+        Attributes: name (str)
+        Notes: Exponentiation and inverses by Python's pow, which runs in
+               C. The sieve and Baillie-PSW test are PureBackend's, with
+               the Miller-Rabin rounds on pow.
+    """
+    name = BACKEND_BUILTIN
+
+    @staticmethod
+    def exp_mod(x, y, n):
+        """ BuiltinBackend Method: exp_mod (public, static)
+            Parameters: x: base     (int)
+                        y: exponent (int)
+                        n: modulus  (int)
+            Returns: x^y mod n      (int)
+        """
+        return pow(x, y, n)
+
+    @staticmethod
+    def inverse(a, n):
+        """ BuiltinBackend Method: inverse (public, static)
+            Parameters: a (int)
+                        n: modulus (int)
+            Returns: a^-1 mod n (int)
+            Notes: Raises ValueError if a has no inverse mod n.
+        """
+        return pow(a, -1, n)
+
+    @staticmethod
+    def is_prime(candidate, num_of_tests):
+        """ BuiltinBackend Method: is_prime (public, static)
+            Parameters: candidate    (int)
+                        num_of_tests (int) (random-base Miller-Rabin rounds)
+            Returns: True/False (bool)
+        """
+        return Keygen.RSAKey.is_prime(candidate, num_of_tests, pow)
+
+    @staticmethod
+    def random_prime(floor, ceiling, num_of_tests):
+        """ BuiltinBackend Method: random_prime (public, static)
+            Parameters: floor, ceiling (ints) (floor is odd)
+                        num_of_tests   (int)
+            Returns: a random prime between floor and ceiling (int)
+        """
+        return Keygen.RSAKey.search_prime(floor, ceiling, num_of_tests,
+                                          exp_mod=pow)
+
+
+class Gmpy2Backend:
+    """ Class: Gmpy2Backend
+        Attributes: name (str)
+        Notes: Every operation runs in GMP. Results are converted back to
+               int, so callers never see gmpy2's mpz type. Only usable
+               when gmpy2 is installed.
+    """
+    name = BACKEND_GMPY2
+    __secrets_random = secrets.SystemRandom()
+
+    @staticmethod
+    def exp_mod(x, y, n):
+        """ Gmpy2Backend Method: exp_mod (public, static)
+            Parameters: x: base     (int)
+                        y: exponent (int)
+                        n: modulus  (int)
+            Returns: x^y mod n      (int)
+        """
+        return int(gmpy2.powmod(x, y, n))
+
+    @staticmethod
+    def inverse(a, n):
+        """ Gmpy2Backend Method: inverse (public, static)
+            Parameters: a (int)
+                        n: modulus (int)
+            Returns: a^-1 mod n (int)
+            Notes: Raises ValueError if a has no inverse mod n, as pow
+                   does; gmpy2 raises ZeroDivisionError.
+        """
+        try:
+            return int(gmpy2.invert(a, n))
+        except ZeroDivisionError:
+            raise ValueError("base is not invertible for the given modulus")
+
+    @staticmethod
+    def is_prime(candidate, num_of_tests):
+        """ Gmpy2Backend Method: is_prime (public, static)
+            Parameters: candidate    (int)
+                        num_of_tests (int) (random-base Miller-Rabin rounds)
+            Returns: True/False (bool)
+            Notes: GMP runs trial division and Baillie-PSW before its
+                   Miller-Rabin rounds; one round is added for the fixed
+                   base-2 round of RSAKey.is_prime.
+        """
+        if candidate < 2:
+            return False
+        return bool(gmpy2.is_prime(candidate, num_of_tests + 1))
+
+    @staticmethod
+    def random_prime(floor, ceiling, num_of_tests):
+        """ Gmpy2Backend Method: random_prime (public, static)
+            Parameters: floor, ceiling (ints) (floor is odd)
+                        num_of_tests   (int)
+            Returns: a random prime between floor and ceiling (int)
+            Notes: Walks forward from a random odd starting point with
+                   gmpy2.next_prime, as RSAKey.search_prime does with its
+                   sieve.
+        """
+        while True:
+            start = Gmpy2Backend.__secrets_random.randrange(floor, ceiling, 2)
+            prime = int(gmpy2.next_prime(start))
+            if prime < ceiling and \
+                    Gmpy2Backend.is_prime(prime, num_of_tests):
+                return prime
+
+
+BACKENDS = {BACKEND_PURE: PureBackend, BACKEND_BUILTIN: BuiltinBackend}
+if gmpy2 is not None:
+    BACKENDS[BACKEND_GMPY2] = Gmpy2Backend
+
+# Backend used by Keygen; gmpy2 when installed, else builtin.
+ACTIVE = BACKENDS.get(BACKEND_GMPY2, BuiltinBackend)
+
+
+def get_backend(name=None):
+    """ Function: get_backend
+        Parameter: name (str) (one of BACKENDS, or None for ACTIVE)
+        Returns: the backend class
+        Notes: Raises ValueError for an unknown name, or for gmpy2 when it
+               is not installed.
+    """
+    if name is None:
+        return ACTIVE
+    if name not in BACKENDS:
+        raise ValueError("backend " + name + " is not available")
+    return BACKENDS[name]
+
+
+def set_backend(name):
+    """ Function: set_backend
+        Parameter: name (str) (one of BACKENDS)
+        Returns: the backend class now active
+        Notes: Applies to this process; worker processes already started
+               keep the backend they started with.
+    """
+    global ACTIVE
+    ACTIVE = get_backend(name)
+    return ACTIVE
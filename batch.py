@@ -0,0 +1,244 @@
+""" CS5001-5003, Spring 2022
+    Final Project (batch module)
+    Norrec Nieh
+"""
+
+import Keygen
+import encrypt
+import decrypt
+import argparse
+import concurrent.futures
+import glob
+import os
+import sys
+import time
+
+ENCRYPTED_SUFFIX = ".enc"  # appended to encrypted outputs
+DECRYPTED_SUFFIX = ".dec"  # appended to decrypted outputs without .enc
+PARTIAL_SUFFIX = ".partial"  # outputs are renamed into place when complete
+
+# Key shipped to each worker process once, by _init_worker.
+_worker_key = None
+
+
+def find_inputs(patterns):
+    """ Function: find_inputs
+        Parameter: patterns (list of str) (files, directories or glob
+                                           patterns)
+        Returns: list of (input path, path relative to its root) tuples
+        Notes: Directories are walked recursively, and their files keep
+               their layout relative to the directory. Files named
+               directly or matched by a pattern are placed by name alone.
+    """
+    inputs = []
+    for pattern in patterns:
+        matches = glob.glob(pattern, recursive=True) or [pattern]
+        for match in sorted(matches):
+            if os.path.isdir(match):
+                for root, directories, files in os.walk(match):
+                    directories.sort()
+                    for file_name in sorted(files):
+                        path = os.path.join(root, file_name)
+                        inputs.append((path, os.path.relpath(path, match)))
+            else:
+                inputs.append((match, os.path.basename(match)))
+    return inputs
+
+
+def output_path(relative_path, out_dir, operation):
+    """ Function: output_path
+        Parameters: relative_path (str)
+                    out_dir       (str)
+                    operation     (str) ("encrypt" or "decrypt")
+        Returns: path of the output for relative_path (str)
+        Notes: Encryption appends ENCRYPTED_SUFFIX; decryption removes it,
+               or appends DECRYPTED_SUFFIX if it is not there.
+    """
+    if operation == "encrypt":
+        relative_path += ENCRYPTED_SUFFIX
+    elif relative_path.endswith(ENCRYPTED_SUFFIX):
+        relative_path = relative_path[:-len(ENCRYPTED_SUFFIX)]
+    else:
+        relative_path += DECRYPTED_SUFFIX
+    return os.path.join(out_dir, relative_path)
+
+
+def is_up_to_date(in_path, out_path, key_path=None):
+    """ Function: is_up_to_date
+        Parameters: in_path  (str)
+                    out_path (str)
+                    key_path (str) (key file used, or None)
+        Returns: True/False (bool)
+        Notes: An output is up to date when it is newer than both its input
+               and the key file. Outputs are only renamed into place once
+               complete, so an interrupted run never looks up to date.
+    """
+    try:
+        out_mtime = os.stat(out_path).st_mtime_ns
+        if out_mtime < os.stat(in_path).st_mtime_ns:
+            return False
+        return key_path is None or out_mtime >= os.stat(key_path).st_mtime_ns
+    except OSError:
+        return False
+
+
+def load_key(args):
+    """ Function: load_key
+        Parameter: args (argparse.Namespace)
+        Returns: key shipped to the workers: (n, e) for encryption,
+                 (n, private_key) for decryption, or None on failure
+        Notes: The key is loaded once for the whole batch. Encrypting
+               without --public-key generates and exports one key pair of
+               --key-size and --primes first.
+    """
+    if args.operation == "decrypt":
+        entry = decrypt.get_key_pair(args.private_key, args.public_key)
+        if entry is None:
+            return None
+        return entry["n"], entry["private_key"]
+
+    if args.public_key is None:
+        key = Keygen.RSAKey(args.key_size, export=False,
+                            prime_count=args.primes)
+        key.export_keys()
+        args.public_key = Keygen.PUBLIC_KEY_PATH
+        print("Generated a ", args.key_size, "-bit key pair in keys/.",
+              sep="")
+    return encrypt.get_public_key(args.public_key)
+
+
+def run_batch(jobs, operation, key, mode=encrypt.MODE_BLOCK, workers=1):
+    """ Function: run_batch (generator)
+        Parameters: jobs      (list of (input path, output path) tuples)
+                    operation (str) ("encrypt" or "decrypt")
+                    key       (tuple) (as returned by load_key)
+                    mode      (str) (encryption mode)
+                    workers   (int) (processes; 1 runs in this process)
+        Yields: (input path, success (bool), seconds (float)) tuples, in
+                the order the files finish
+    """
+    if workers <= 1:
+        _init_worker(key)
+        for in_path, out_path in jobs:
+            yield _process_file(operation, in_path, out_path, mode)
+        return
+
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker,
+            initargs=(key,)) as executor:
+        futures = [executor.submit(_process_file, operation, in_path,
+                                   out_path, mode)
+                   for in_path, out_path in jobs]
+        for future in concurrent.futures.as_completed(futures):
+            yield future.result()
+
+
+def _init_worker(key):
+    """ Function: _init_worker (private)
+        Parameter: key (tuple)
+        Returns: None
+        Notes: Runs once in each worker process, so the key is not pickled
+               with every file.
+    """
+    global _worker_key
+    _worker_key = key
+
+
+def _process_file(operation, in_path, out_path, mode):
+    """ Function: _process_file (private)
+        Parameters: operation         (str)
+                    in_path, out_path (str)
+                    mode              (str)
+        Returns: in_path (str), success (bool), seconds (float)
+        Notes: Writes to a partial file that is renamed to out_path only
+               if the file was processed in full.
+    """
+    start_time = time.perf_counter()
+    partial_path = out_path + PARTIAL_SUFFIX
+    try:
+        os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+        with open(in_path) as file_handle:
+            if operation == "encrypt":
+                success = encrypt.encrypt(file_handle, out_path=partial_path,
+                                          mode=mode, public_key=_worker_key)
+            else:
+                success = decrypt.decrypt(file_handle, partial_path,
+                                          key=_worker_key)
+    except (OSError, UnicodeDecodeError):
+        print("Error occurred while reading ", in_path, ".", sep="")
+        success = False
+
+    if success:
+        os.replace(partial_path, out_path)
+    elif os.path.exists(partial_path):
+        os.remove(partial_path)
+    return in_path, success, time.perf_counter() - start_time
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Encrypt or decrypt files in bulk with one key.")
+    parser.add_argument("operation", choices=("encrypt", "decrypt"))
+    parser.add_argument("inputs", nargs="+",
+                        help="files, directories or glob patterns")
+    parser.add_argument("-o", "--output-dir", required=True,
+                        help="directory the outputs are written to")
+    parser.add_argument("--public-key", default=None,
+                        help="public key file (encrypting without one "
+                             "generates a key pair)")
+    parser.add_argument("--private-key", default=Keygen.PRIVATE_KEY_PATH)
+    parser.add_argument("--key-size", type=int, default=2048,
+                        choices=(1024, 2048, 3072, 4096))
+    parser.add_argument("--primes", type=int, default=2,
+                        choices=range(2, Keygen.MAX_PRIME_COUNT + 1),
+                        help="primes in a generated key")
+    parser.add_argument("--mode", default=encrypt.MODE_BLOCK,
+                        choices=(encrypt.MODE_BLOCK, encrypt.MODE_HYBRID))
+    parser.add_argument("-w", "--workers", type=int, default=1,
+                        help="processes working on files at once")
+    parser.add_argument("--force", action="store_true",
+                        help="process files whose output is up to date")
+    args = parser.parse_args()
+    if args.operation == "decrypt" and args.public_key is None:
+        args.public_key = Keygen.PUBLIC_KEY_PATH
+
+    inputs = find_inputs(args.inputs)
+    jobs = [(in_path, output_path(relative_path, args.output_dir,
+                                  args.operation))
+            for in_path, relative_path in inputs]
+    if len(set(out_path for in_path, out_path in jobs)) != len(jobs):
+        print("Several inputs map to the same output; "
+              "pass their directory instead.")
+        sys.exit(2)
+
+    key = load_key(args)
+    if key is None:
+        sys.exit(1)
+    key_path = args.private_key if args.operation == "decrypt" \
+        else args.public_key
+
+    skipped = [in_path for in_path, out_path in jobs
+               if not args.force and is_up_to_date(in_path, out_path,
+                                                   key_path)]
+    skipped_paths = set(skipped)
+    jobs = [job for job in jobs if job[0] not in skipped_paths]
+
+    start_time = time.perf_counter()
+    failed = 0
+    for in_path, success, seconds in run_batch(jobs, args.operation, key,
+                                               args.mode, args.workers):
+        failed += not success
+        print(format(seconds * 1000, "10.2f"), " ms  ",
+              "ok    " if success else "FAILED", "  ", in_path, sep="")
+    for in_path in skipped:
+        print(" " * 13, " skip    ", in_path, sep="")
+
+    print("\n", len(jobs) - failed, " processed, ", len(skipped),
+          " up to date, ", failed, " failed in ",
+          format(time.perf_counter() - start_time, ".2f"), " s.", sep="")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+""" CS5001-5003, Spring 2022
+    Final Project (benchmark module)
+    Norrec Nieh
+"""
+
+import Keygen
+import encrypt
+import decrypt
+import argparse
+import json
+import os
+import platform
+import secrets
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+KEY_SIZES = (1024, 2048, 3072, 4096)
+PAYLOAD_SIZES = (1024, 16384, 131072)  # bytes of plaintext
+REPEATS = 7  # timed runs per measurement
+KEYGEN_REPEATS = 3  # key generation is slow at the larger sizes
+RESULTS_PATH = "files/benchmark.json"
+BASELINE_PATH = "files/benchmark_baseline.json"
+REGRESSION_THRESHOLD = 0.20  # slowdown of the median flagged as regression
+
+
+def measure(function, repeats=REPEATS, payload_size=None):
+    """ Function: measure
+        Parameters: function     (function of no arguments)
+                    repeats      (int) (timed runs)
+                    payload_size (int) (bytes processed per run, or None)
+        Returns: dict containing ["median_seconds"], ["p95_seconds"],
+                 ["peak_memory_bytes"], ["repeats"], and
+                 ["throughput_bytes_per_second"] when payload_size is given
+        Notes: The timed runs go without tracemalloc, which slows Python
+               down considerably; one further traced run gives the peak
+               memory.
+    """
+    timings = []
+    for repeat in range(repeats):
+        start_time = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start_time)
+
+    tracemalloc.start()
+    try:
+        function()
+        peak_memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    median = statistics.median(timings)
+    result = {"median_seconds": median,
+              "p95_seconds": percentile(timings, 0.95),
+              "peak_memory_bytes": peak_memory,
+              "repeats": repeats}
+    if payload_size is not None:
+        result["throughput_bytes_per_second"] = \
+            payload_size / median if median else 0.0
+    return result
+
+
+def percentile(values, fraction):
+    """ Function: percentile
+        Parameters: values   (list of floats)
+                    fraction (float) (0 to 1)
+        Returns: nearest-rank percentile of values (float)
+    """
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * fraction // 1))  # ceiling
+    return ordered[int(rank) - 1]
+
+
+def run_benchmarks(key_sizes=KEY_SIZES, payload_sizes=PAYLOAD_SIZES,
+                   repeats=REPEATS, keygen_repeats=KEYGEN_REPEATS):
+    """ Function: run_benchmarks
+        Parameters: key_sizes      (tuple of ints)
+                    payload_sizes  (tuple of ints) (bytes)
+                    repeats        (int)
+                    keygen_repeats (int)
+        Returns: dict of benchmark name (str) -> measurement (dict, as
+                 returned by measure)
+        Notes: Names are "operation/key size" or "operation/key size/
+               payload size". Keys, plaintexts and ciphertexts are written
+               to a temporary directory, so keys/ and files/ are left as
+               they are. Payloads are random ASCII text, so every run of
+               the suite encrypts the same amount of data.
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        public_key_path = os.path.join(directory, "public_key.pem")
+        private_key_path = os.path.join(directory, "private_key.pem")
+        plain_path = os.path.join(directory, "plain.txt")
+        cipher_path = os.path.join(directory, "encrypted.txt")
+        decrypted_path = os.path.join(directory, "decrypted.txt")
+
+        for key_size in key_sizes:
+            results["keygen/" + str(key_size)] = measure(
+                lambda: Keygen.RSAKey(key_size, export=False),
+                keygen_repeats)
+
+            key = Keygen.RSAKey(key_size, export=False)
+            key.export_keys(public_key_path, private_key_path)
+            n = key.get_public_key()["n"]
+            base = secrets.randbelow(n)
+            private_exponent = decrypt.get_private_key(
+                private_key_path, public_key_path)["d"]
+            results["exp_mod_iter/" + str(key_size)] = measure(
+                lambda: Keygen.RSAKey.exp_mod_iter(base, private_exponent, n),
+                repeats)
+
+            for payload_size in payload_sizes:
+                name = "/" + str(key_size) + "/" + str(payload_size)
+                with open(plain_path, "w") as plain_file:
+                    plain_file.write(random_text(payload_size))
+
+                def run_encrypt():
+                    with open(plain_path) as file_handle:
+                        if not encrypt.encrypt(file_handle,
+                                               out_path=cipher_path,
+                                               public_key=public_key_path):
+                            raise RuntimeError("encryption failed")
+
+                def run_decrypt():
+                    with open(cipher_path) as file_handle:
+                        if not decrypt.decrypt(
+                                file_handle, decrypted_path,
+                                public_key_path=public_key_path,
+                                private_key_path=private_key_path):
+                            raise RuntimeError("decryption failed")
+
+                results["encrypt" + name] = measure(run_encrypt, repeats,
+                                                    payload_size)
+                results["decrypt" + name] = measure(run_decrypt, repeats,
+                                                    payload_size)
+
+        # the conversions do not depend on the key size.
+        for payload_size in payload_sizes:
+            text = random_text(payload_size)
+            value = encrypt.str_to_int(text)
+            results["str_to_int/" + str(payload_size)] = measure(
+                lambda: encrypt.str_to_int(text), repeats, payload_size)
+            results["int_to_str/" + str(payload_size)] = measure(
+                lambda: decrypt.int_to_str(value), repeats, payload_size)
+    return results
+
+
+def random_text(size):
+    """ Function: random_text
+        Parameter: size (int)
+        Returns: random printable ASCII text of size characters, in lines
+                 of 80 (str)
+    """
+    alphabet = "abcdefghijklmnopqrstuvwxyz ABCDEFGHIJKLMNOPQRSTUVWXYZ.,"
+    characters = [secrets.choice(alphabet) for index in range(size)]
+    for index in range(79, size, 80):
+        characters[index] = "\n"
+    return "".join(characters)
+
+
+def compare(results, baseline, threshold=REGRESSION_THRESHOLD):
+    """ Function: compare
+        Parameters: results   (dict, as returned by run_benchmarks)
+                    baseline  (dict, as returned by run_benchmarks)
+                    threshold (float) (allowed slowdown, 0.2 = 20%)
+        Returns: list of (name, baseline median, current median, ratio)
+                 tuples for each benchmark that regressed
+        Notes: Only benchmarks present in both are compared.
+    """
+    regressions = []
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        before = baseline[name]["median_seconds"]
+        after = results[name]["median_seconds"]
+        if before > 0 and after > before * (1 + threshold):
+            regressions.append((name, before, after, after / before))
+    return regressions
+
+
+def export_results(results, path=RESULTS_PATH):
+    """ Function: export_results
+        Parameters: results (dict, as returned by run_benchmarks)
+                    path    (str)
+        Returns: None
+        Notes: The results are written with the Python version and
+               platform they were measured on.
+    """
+    report = {"python": platform.python_version(),
+              "platform": platform.platform(),
+              "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+              "results": results}
+    with open(path, "w") as file:
+        json.dump(report, file, indent=2, sort_keys=True)
+
+
+def load_results(path):
+    """ Function: load_results
+        Parameter: path (str)
+        Returns: results (dict) stored by export_results
+    """
+    with open(path) as file:
+        return json.load(file)["results"]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark key generation, encryption and decryption.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=KEY_SIZES,
+                        help="key sizes in bits")
+    parser.add_argument("--payloads", type=int, nargs="+",
+                        default=PAYLOAD_SIZES, help="payload sizes in bytes")
+    parser.add_argument("--repeats", type=int, default=REPEATS)
+    parser.add_argument("--keygen-repeats", type=int, default=KEYGEN_REPEATS)
+    parser.add_argument("--output", default=RESULTS_PATH)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--threshold", type=float,
+                        default=REGRESSION_THRESHOLD)
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="store these results as the new baseline")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.sizes, args.payloads, args.repeats,
+                             args.keygen_repeats)
+    export_results(results, args.output)
+
+    for name, result in results.items():
+        line = name.ljust(28) + \
+            "median " + format(result["median_seconds"] * 1000, ".2f") + \
+            " ms, p95 " + format(result["p95_seconds"] * 1000, ".2f") + \
+            " ms, peak " + format(result["peak_memory_bytes"] / 1024, ".0f") \
+            + " KiB"
+        if "throughput_bytes_per_second" in result:
+            line += ", " + format(
+                result["throughput_bytes_per_second"] / 1024, ".1f") + " KiB/s"
+        print(line)
+    print("\nResults written to ", args.output, ".", sep="")
+
+    if args.save_baseline:
+        export_results(results, args.baseline)
+        print("Baseline written to ", args.baseline, ".", sep="")
+        return
+
+    try:
+        baseline = load_results(args.baseline)
+    except FileNotFoundError:
+        print("No baseline at ", args.baseline,
+              "; run with --save-baseline to store one.", sep="")
+        return
+
+    regressions = compare(results, baseline, args.threshold)
+    if not regressions:
+        print("No regressions against ", args.baseline, ".", sep="")
+        return
+    print("\nRegressions against ", args.baseline, ":", sep="")
+    for name, before, after, ratio in regressions:
+        print("  ", name, ": ", format(before * 1000, ".2f"), " ms -> ",
+              format(after * 1000, ".2f"), " ms (x", format(ratio, ".2f"),
+              ")", sep="")
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,507 @@
+""" CS5001-5003, Spring 2022
+    Final Project (daemon module)
+    Norrec Nieh
+"""
+
+import Keygen
+import encrypt
+import decrypt
+import keyring
+import signature
+import argparse
+import base64
+import concurrent.futures
+import errno
+import json
+import os
+import queue
+import signal
+import socket
+import socketserver
+import stat
+import struct
+import tempfile
+
+SOCKET_PATH = "files/rsa.sock"
+MAX_MESSAGE_SIZE = 64 * 1024 * 1024  # bytes of header and payload accepted
+FRAME_PREFIX = struct.Struct(">II")  # header length, payload length
+OPERATIONS = ("encrypt", "decrypt", "sign", "verify")
+DEFAULT_POOL_SIZE = 4  # connections kept open by a DaemonClient
+
+# Keys shipped to each worker process once, by _init_worker, as
+# fingerprint -> (n, e, private_key or None).
+_worker_keys = None
+
+
+class DaemonError(Exception):
+    """ Class: DaemonError
+        Notes: Raised by DaemonClient when the daemon rejects a request.
+    """
+
+
+class CryptoDaemon(socketserver.ThreadingMixIn,
+                   socketserver.UnixStreamServer):
+    """ Class: CryptoDaemon
+        Attributes: keys (dict) (fingerprint -> (n, e, private_key or None))
+                    default_key (str) (fingerprint used when a request
+                                       names none)
+                    executor (ProcessPoolExecutor)
+        Notes: Serves encrypt, decrypt, sign and verify requests on a Unix
+               domain socket, with the keys loaded once at startup. Each
+               connection gets a thread, which may send any number of
+               requests in turn; the exponentiations run in a process pool
+               that received the keys once, when it started.
+               The socket is only accessible to the user running the
+               daemon, since any client can decrypt and sign with its keys.
+    """
+    daemon_threads = True
+
+    def __init__(self, socket_path, keys, workers=None):
+        """ Method: __init__ (constructor)
+            Parameters: socket_path (str)
+                        keys        (list of (n, e, private_key or None)
+                                     tuples) (the first is the default)
+                        workers     (int) (processes in the pool, defaults
+                                           to the number of cores)
+            Returns: None
+            Notes: Raises ValueError if no key is given, and OSError if
+                   the socket cannot be bound or another daemon is
+                   listening on it.
+        """
+        if not keys:
+            raise ValueError("the daemon needs at least one key")
+        self.keys = {keyring.fingerprint(n): (n, e, private_key)
+                     for n, e, private_key in keys}
+        self.default_key = keyring.fingerprint(keys[0][0])
+
+        remove_stale_socket(socket_path)
+        old_umask = os.umask(0o177)
+        try:
+            super().__init__(socket_path, _RequestHandler)
+        finally:
+            os.umask(old_umask)
+        self.executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker,
+            initargs=(self.keys,))
+
+    def handle_request_message(self, header, payload):
+        """ CryptoDaemon Method: handle_request_message (public)
+            Parameters: header  (dict) (decoded request header)
+                        payload (bytes)
+            Returns: response header (dict), response payload (bytes)
+        """
+        operation = header.get("op")
+        if operation == "ping":
+            return {"ok": True}, b""
+        if operation == "keys":
+            return {"ok": True, "keys": list(self.keys),
+                    "default": self.default_key}, b""
+        if operation not in OPERATIONS:
+            return {"ok": False, "error": "unknown operation"}, b""
+
+        fingerprint = header.get("key") or self.default_key
+        if not isinstance(fingerprint, str) or fingerprint not in self.keys:
+            return {"ok": False, "error": "unknown key"}, b""
+        error, result = self.executor.submit(
+            _run_operation, operation, fingerprint, payload,
+            header.get("signature")).result()
+        if error is not None:
+            return {"ok": False, "error": error}, b""
+        return {"ok": True}, result
+
+    def server_close(self):
+        """ CryptoDaemon Method: server_close (public)
+            Parameters: None
+            Returns: None
+            Notes: Also shuts down the process pool and removes the socket.
+        """
+        super().server_close()
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+
+
+class _RequestHandler(socketserver.BaseRequestHandler):
+    """ Class: _RequestHandler (private)
+        Notes: Answers requests on one connection until the client closes
+               it or sends a malformed message.
+    """
+
+    def handle(self):
+        while True:
+            try:
+                message = read_message(self.request)
+            except (OSError, ValueError):
+                return
+            if message is None:
+                return  # client closed the connection.
+            header, payload = message
+            try:
+                response = self.server.handle_request_message(header,
+                                                              payload)
+            except concurrent.futures.BrokenExecutor:
+                response = {"ok": False, "error": "worker failed"}, b""
+            try:
+                send_message(self.request, *response)
+            except OSError:
+                return
+
+
+class DaemonClient:
+    """ Class: DaemonClient
+        Attributes: __socket_path (str)
+                    __connections (queue.LifoQueue) (idle connections)
+                    __pool_size (int) (idle connections kept)
+        Notes: Thin client for CryptoDaemon. Connections are reused across
+               requests and shared between threads; a thread takes an idle
+               connection, or opens one if none is idle, and puts it back
+               when its request is done. Methods raise DaemonError when the
+               daemon rejects a request, and OSError when it cannot be
+               reached.
+    """
+
+    def __init__(self, socket_path=SOCKET_PATH, pool_size=DEFAULT_POOL_SIZE):
+        """ Method: __init__ (constructor)
+            Parameters: socket_path (str)
+                        pool_size   (int)
+            Returns: None
+        """
+        self.__socket_path = socket_path
+        self.__pool_size = pool_size
+        self.__connections = queue.LifoQueue()
+
+    def encrypt(self, data, key=None):
+        """ DaemonClient Method: encrypt (public)
+            Parameters: data (bytes)
+                        key  (str) (fingerprint, or None for the default)
+            Returns: ciphertext in the format of encrypt.encrypt_binary
+                     (bytes)
+        """
+        return self.request("encrypt", data, key)[1]
+
+    def decrypt(self, data, key=None):
+        """ DaemonClient Method: decrypt (public)
+            Parameters: data (bytes) (as returned by encrypt)
+                        key  (str) (fingerprint, or None for the default)
+            Returns: plaintext (bytes)
+        """
+        return self.request("decrypt", data, key)[1]
+
+    def sign(self, data, key=None):
+        """ DaemonClient Method: sign (public)
+            Parameters: data (bytes)
+                        key  (str) (fingerprint, or None for the default)
+            Returns: signature (bytes)
+        """
+        return self.request("sign", data, key)[1]
+
+    def verify(self, data, signature_bytes, key=None):
+        """ DaemonClient Method: verify (public)
+            Parameters: data            (bytes)
+                        signature_bytes (bytes)
+                        key             (str) (fingerprint, or None for the
+                                               default)
+            Returns: True/False (bool)
+        """
+        return self.request("verify", data, key,
+                            signature_bytes)[1] == b"\x01"
+
+    def keys(self):
+        """ DaemonClient Method: keys (public)
+            Parameters: None
+            Returns: fingerprints of the daemon's keys, the default first
+                     (list of str)
+        """
+        header = self.request("keys")[0]
+        return [header["default"]] + [fingerprint for fingerprint
+                                      in header["keys"]
+                                      if fingerprint != header["default"]]
+
+    def ping(self):
+        """ DaemonClient Method: ping (public)
+            Parameters: None
+            Returns: None
+        """
+        self.request("ping")
+
+    def request(self, operation, payload=b"", key=None, signature_bytes=None):
+        """ DaemonClient Method: request (public)
+            Parameters: operation       (str)
+                        payload         (bytes)
+                        key             (str) (fingerprint, or None)
+                        signature_bytes (bytes) (verify only)
+            Returns: response header (dict), response payload (bytes)
+            Notes: A connection that fails mid-request is closed rather
+                   than returned to the pool.
+        """
+        header = {"op": operation}
+        if key is not None:
+            header["key"] = key
+        if signature_bytes is not None:
+            header["signature"] = base64.b64encode(signature_bytes).decode()
+
+        connection = self.__take_connection()
+        try:
+            send_message(connection, header, payload)
+            response = read_message(connection)
+            if response is None:
+                raise ConnectionError("daemon closed the connection")
+        except BaseException:
+            connection.close()
+            raise
+        self.__return_connection(connection)
+
+        response_header, response_payload = response
+        if not response_header.get("ok"):
+            raise DaemonError(response_header.get("error", "request failed"))
+        return response_header, response_payload
+
+    def close(self):
+        """ DaemonClient Method: close (public)
+            Parameters: None
+            Returns: None
+            Notes: Closes the idle connections.
+        """
+        while True:
+            try:
+                self.__connections.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def __take_connection(self):
+        """ DaemonClient Method: __take_connection (private)
+            Parameters: None
+            Returns: an idle connection, or a new one (socket)
+        """
+        try:
+            return self.__connections.get_nowait()
+        except queue.Empty:
+            connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                connection.connect(self.__socket_path)
+            except OSError:
+                connection.close()
+                raise
+            return connection
+
+    def __return_connection(self, connection):
+        """ DaemonClient Method: __return_connection (private)
+            Parameter: connection (socket)
+            Returns: None
+        """
+        if self.__connections.qsize() < self.__pool_size:
+            self.__connections.put(connection)
+        else:
+            connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def remove_stale_socket(socket_path):
+    """ Function: remove_stale_socket
+        Parameter: socket_path (str)
+        Returns: None
+        Notes: Removes a socket left behind by a daemon that died, found
+               by a refused connection. Raises OSError (EADDRINUSE) if a
+               daemon still accepts connections on it, or FileExistsError
+               if the path is not a socket, rather than taking it over.
+    """
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socket_path)
+    except FileNotFoundError:
+        return
+    except ConnectionRefusedError:
+        if not stat.S_ISSOCK(os.stat(socket_path).st_mode):
+            raise FileExistsError(errno.EEXIST, "not a socket", socket_path)
+        os.remove(socket_path)
+        return
+    finally:
+        probe.close()
+    raise OSError(errno.EADDRINUSE, "a daemon is already listening",
+                  socket_path)
+
+
+def send_message(connection, header, payload=b""):
+    """ Function: send_message
+        Parameters: connection (socket)
+                    header     (dict) (JSON-serialisable)
+                    payload    (bytes)
+        Returns: None
+        Notes: Message format: the header and payload lengths as 4-byte
+               big-endian ints, the header as UTF-8 JSON, then the payload.
+    """
+    header_bytes = json.dumps(header).encode()
+    connection.sendall(FRAME_PREFIX.pack(len(header_bytes), len(payload)) +
+                       header_bytes + payload)
+
+
+def read_message(connection):
+    """ Function: read_message
+        Parameter: connection (socket)
+        Returns: header (dict), payload (bytes), or None if the connection
+                 was closed before a message began
+        Notes: Raises ValueError on a malformed or oversized message.
+    """
+    prefix = read_exactly(connection, FRAME_PREFIX.size)
+    if prefix is None:
+        return None
+    header_length, payload_length = FRAME_PREFIX.unpack(prefix)
+    if header_length + payload_length > MAX_MESSAGE_SIZE:
+        raise ValueError("message too large")
+    body = read_exactly(connection, header_length + payload_length)
+    if body is None:
+        raise ValueError("connection closed mid-message")
+    header = json.loads(body[:header_length])
+    if not isinstance(header, dict):
+        raise ValueError("header is not an object")
+    return header, body[header_length:]
+
+
+def read_exactly(connection, size):
+    """ Function: read_exactly
+        Parameters: connection (socket)
+                    size       (int)
+        Returns: size bytes (bytes), or None if the connection was closed
+                 before any of them arrived
+        Notes: Raises ValueError if it is closed partway through.
+    """
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = connection.recv_into(view[received:])
+        if count == 0:
+            if received == 0:
+                return None
+            raise ValueError("connection closed mid-message")
+        received += count
+    return bytes(buffer)
+
+
+def load_keys(key_paths, key_size=None):
+    """ Function: load_keys
+        Parameters: key_paths (list of (public key path, private key path
+                               or None) pairs)
+                    key_size  (int) (size of a key to generate in memory,
+                                     or None)
+        Returns: list of (n, e, private_key or None) tuples, or None if a
+                 key file could not be read
+    """
+    keys = []
+    for public_key_path, private_key_path in key_paths:
+        try:
+            entry = keyring.DEFAULT_KEYRING.load_public_key(public_key_path)
+            if private_key_path is not None:
+                entry = keyring.DEFAULT_KEYRING.load_private_key(
+                    private_key_path, public_key_path)
+        except (OSError, ValueError):
+            print("Error occurred while reading ", public_key_path, " or ",
+                  private_key_path, ".", sep="")
+            return None
+        keys.append((entry["n"], entry["e"], entry["private_key"]))
+
+    if key_size is not None:
+        # the key files are parsed back like any other, then deleted.
+        with tempfile.TemporaryDirectory() as directory:
+            public_key_path = os.path.join(directory, "public_key.pem")
+            private_key_path = os.path.join(directory, "private_key.pem")
+            Keygen.RSAKey(key_size, export=False).export_keys(
+                public_key_path, private_key_path)
+            generated = load_keys([(public_key_path, private_key_path)])
+        keys.extend(generated)
+    return keys
+
+
+def _init_worker(keys):
+    """ Function: _init_worker (private)
+        Parameter: keys (dict)
+        Returns: None
+        Notes: Runs once in each worker process, so the keys are not
+               pickled with every request. Workers leave SIGINT to the
+               daemon, which shuts them down itself.
+    """
+    global _worker_keys
+    _worker_keys = keys
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _run_operation(operation, fingerprint, payload, encoded_signature):
+    """ Function: _run_operation (private)
+        Parameters: operation         (str) (one of OPERATIONS)
+                    fingerprint       (str)
+                    payload           (bytes)
+                    encoded_signature (str) (base64, verify only)
+        Returns: error message (str) or None, result (bytes)
+        Notes: Runs in a worker process.
+    """
+    n, e, private_key = _worker_keys[fingerprint]
+    if operation == "encrypt":
+        return None, encrypt.encrypt_bytes(payload, (n, e))
+    if operation == "verify":
+        try:
+            signature_bytes = base64.b64decode(encoded_signature or "",
+                                               validate=True)
+        except (TypeError, ValueError):
+            return "malformed signature", b""
+        valid = signature.verify(payload, signature_bytes, (n, e))
+        return None, b"\x01" if valid else b"\x00"
+
+    if private_key is None:
+        return "no private key loaded for this key", b""
+    if operation == "decrypt":
+        result = decrypt.decrypt_bytes(payload, (n, private_key))
+    else:
+        result = signature.sign(payload, key=(n, private_key))
+    if result is None:
+        return operation + " failed", b""
+    return None, result
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Serve encryption, decryption and signing on a Unix "
+                    "socket, with the keys loaded once.")
+    parser.add_argument("--socket", default=SOCKET_PATH)
+    parser.add_argument("--key", nargs=2, action="append",
+                        metavar=("PUBLIC", "PRIVATE"),
+                        help="key pair to serve (repeatable; the first is "
+                             "the default)")
+    parser.add_argument("--generate", type=int, default=None,
+                        metavar="KEY_SIZE",
+                        help="also serve a new key of this size, kept in "
+                             "memory only")
+    parser.add_argument("-w", "--workers", type=int, default=None,
+                        help="processes doing the arithmetic")
+    args = parser.parse_args()
+    if args.key is None and args.generate is None:
+        args.key = [(Keygen.PUBLIC_KEY_PATH, Keygen.PRIVATE_KEY_PATH)]
+
+    keys = load_keys(args.key or [], args.generate)
+    if keys is None:
+        raise SystemExit(1)
+    try:
+        server = CryptoDaemon(args.socket, keys, args.workers)
+    except OSError as error:
+        print("Cannot serve on ", args.socket, ": ", error.strerror, ".",
+              sep="")
+        raise SystemExit(1)
+
+    # SIGTERM stops the daemon as Ctrl+C does, removing the socket.
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    print("Serving ", len(keys), " key(s) on ", args.socket, "; default ",
+          server.default_key, ".", sep="", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -5,66 +5,634 @@
 
 import Keygen
 import encrypt
+import keyring
+import metrics
+import modexp
+import parallel
 import base64
+import codecs
+import hashlib
+import hmac
+import mmap
+import os
+import sys
+import time
 
 
-def decrypt(file_handle):
+DECRYPTED_PATH = "files/decrypted.txt"
+BINARY_DECRYPTED_PATH = "files/decrypted.bin"
+PARTIAL_SUFFIX = ".partial"  # outputs are renamed into place when complete
+
+
+def decrypt(file_handle, out_path=DECRYPTED_PATH, workers=1,
+            chunk_size=None, public_key_path=Keygen.PUBLIC_KEY_PATH,
+            private_key_path=Keygen.PRIVATE_KEY_PATH, key=None):
     """ Function: decrypt
-        Parameter: file_handle (str)
+        Parameters: file_handle      (str)
+                    out_path         (str)
+                    workers          (int) (processes used in block mode)
+                    chunk_size       (int) (blocks per worker task, or None
+                                       for parallel.DEFAULT_CHUNK_SIZE)
+                    public_key_path  (str)
+                    private_key_path (str)
+                    key              ((n, private_key) tuple, or None to
+                                      read the key files)
         Returns: True/False (bool)
         Notes: Returns True if decryption successful. Else, returns False.
+               Ciphertext blocks are read, decrypted and written out one at
+               a time, so memory use stays flat regardless of file size.
     """
     try:  # failsafe for unacceptable or corrupted ciphertext.
-        data = file_handle.read().split("\n")
-        ciphertext = Keygen.RSAKey.base64_to_int(data[1])
-
-        # retrieves modulus (and e) from public_key.pem
-        n, e = encrypt.get_public_key()
-        d = get_private_key()  # retrieves d from private_key.pem
+        # retrieves n and d from the key files, or from the keyring
+        # if they have been parsed before.
+        if key is None:
+            entry = get_key_pair(private_key_path, public_key_path)
+            if entry is None:
+                return False
+            key = entry["n"], entry["private_key"]
+        n, private_key = key
 
-        m = Keygen.RSAKey.exp_mod_iter(ciphertext, d, n)  # decrypt
-        decrypted_text = int_to_str(m)  # convert int value to original text
+        # the opening banner tells block-mode and hybrid-mode files apart,
+        # as well as packed blocks from the legacy unmarked ones.
+        banner = file_handle.readline().strip()
+        if banner == "-----BEGIN HYBRID ENCRYPTED MESSAGE-----":
+            blocks = read_hybrid_chunks(file_handle, n, private_key)
+        elif banner == "-----BEGIN MULTI-RECIPIENT ENCRYPTED MESSAGE-----":
+            blocks = read_multi_chunks(file_handle, n, private_key)
+        elif banner == "-----BEGIN PACKED ENCRYPTED MESSAGE-----":
+            ciphertexts = read_ciphertext_blocks(
+                file_handle, "-----END PACKED ENCRYPTED MESSAGE-----")
+            blocks = decrypt_blocks(ciphertexts, n, private_key, workers,
+                                    chunk_size)
+        elif banner == "-----BEGIN ENCRYPTED MESSAGE-----":
+            ciphertexts = read_ciphertext_blocks(
+                file_handle, "-----END ENCRYPTED MESSAGE-----")
+            blocks = decrypt_blocks(ciphertexts, n, private_key, workers,
+                                    chunk_size, packed=False)
+        else:
+            return False
 
         # writes decrypted text to decrypted.txt
-        out_file = open("files/decrypted.txt", "w")
-        out_file.write("-----BEGIN DECRYPTED MESSAGE-----\n" +
-                       decrypted_text +
-                       "\n-----END DECRYPTED MESSAGE-----")
-        out_file.close()
+        export_plaintext(blocks, out_path)
+
+    except ValueError:
+        return False
+
+    return True
+
+
+def decrypt_binary(in_path, out_path=BINARY_DECRYPTED_PATH, workers=1,
+                   chunk_size=None, public_key_path=Keygen.PUBLIC_KEY_PATH,
+                   private_key_path=Keygen.PRIVATE_KEY_PATH, key=None):
+    """ Function: decrypt_binary
+        Parameters: in_path          (str) (written by encrypt.encrypt_binary)
+                    out_path         (str)
+                    workers          (int) (processes used for the
+                                            exponentiations)
+                    chunk_size       (int) (blocks per worker task, or None
+                                       for parallel.DEFAULT_CHUNK_SIZE)
+                    public_key_path  (str)
+                    private_key_path (str)
+                    key              ((n, private_key) tuple, or None to
+                                      read the key files)
+        Returns: True/False (bool)
+        Notes: Binary counterpart of decrypt. The ciphertext is
+               memory-mapped and converted to ints from memoryview slices,
+               and the plaintext bytes are written back exactly, in
+               WRITE_BUFFER_SIZE batches. The header is checked before
+               anything is written, and the plaintext goes to a partial
+               file that is renamed to out_path only once every block has
+               been decrypted, so a failed call leaves out_path untouched.
+    """
+    partial_path = out_path + PARTIAL_SUFFIX
+    try:  # failsafe for unacceptable or corrupted ciphertext.
+        if key is None:
+            entry = get_key_pair(private_key_path, public_key_path)
+            if entry is None:
+                return False
+            key = entry["n"], entry["private_key"]
+        n, private_key = key
+
+        with open(in_path, "rb") as in_file:
+            length, size, total_length = read_binary_header(in_file, n)
+            with open(partial_path, "wb") as out_file:
+                if total_length > 0:  # an empty file cannot be mapped.
+                    # the view is released before the mapping is closed,
+                    # even if a block fails, or closing the mapping raises
+                    # BufferError.
+                    with mmap.mmap(in_file.fileno(), 0,
+                                   access=mmap.ACCESS_READ) as mapped, \
+                            memoryview(mapped) as view:
+                        ciphertexts = (
+                            int.from_bytes(view[position:position + length],
+                                           byteorder='big')
+                            for position in range(encrypt.BINARY_HEADER_SIZE,
+                                                  len(view), length))
+                        blocks = decrypt_blocks(ciphertexts, n, private_key,
+                                                workers, chunk_size)
+                        encrypt.write_buffered(
+                            out_file,
+                            fixed_size_blocks(blocks, size, total_length))
+        os.replace(partial_path, out_path)
+
+    except FileNotFoundError as error:
+        print("File ", error.filename, " was not found.", sep="")
+        return False
+
+    except PermissionError as error:
+        print("Permission denied for ", error.filename, ".", sep="")
+        return False
 
     except ValueError:
         return False
 
-    except SyntaxError:
+    except IOError:
+        print("Error occurred while decrypting ", in_path, ".", sep="")
         return False
 
+    finally:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+
     return True
 
 
-def get_private_key():
-    """ Function: get_private_key
-        Parameters: None
-        Returns: d (int)
-        Notes: Parses public_key.pem for the decryption exponent (d)
+def decrypt_range(in_path, start, length,
+                  public_key_path=Keygen.PUBLIC_KEY_PATH,
+                  private_key_path=Keygen.PRIVATE_KEY_PATH, key=None):
+    """ Function: decrypt_range
+        Parameters: in_path          (str) (written by encrypt.encrypt_binary)
+                    start            (int) (offset into the plaintext)
+                    length           (int) (bytes wanted)
+                    public_key_path  (str)
+                    private_key_path (str)
+                    key              ((n, private_key) tuple, or None to
+                                      read the key files)
+        Returns: plaintext bytes from start to start + length, cut short at
+                 the end of the file (bytes), or None on failure
+        Notes: Every block but the last holds exactly size bytes of
+               plaintext and every ciphertext takes exactly length bytes,
+               so the blocks covering the range are found from the header
+               alone, and only those are read and decrypted.
     """
-    try:  # defensive measure to check file validity for private_key.pem
-        private_key_handle = open("keys/private_key.pem", "r")
-        private_key = private_key_handle.read()
-        private_key = private_key.split("\n")
+    try:  # failsafe for unacceptable or corrupted ciphertext.
+        if start < 0 or length < 0:
+            raise ValueError("range must not be negative")
+        if key is None:
+            entry = get_key_pair(private_key_path, public_key_path)
+            if entry is None:
+                return None
+            key = entry["n"], entry["private_key"]
+        n, private_key = key
 
-        d = Keygen.RSAKey.base64_to_int(private_key[1])
+        with open(in_path, "rb") as in_file:
+            cipher_length, size, total_length = read_binary_header(in_file, n)
+            end = min(start + length, total_length)
+            if start >= end:
+                return b""
+            first_block = start // size
+            last_block = (end - 1) // size
+            in_file.seek(encrypt.BINARY_HEADER_SIZE +
+                         first_block * cipher_length)
+            with metrics.timer("decrypt.io"):
+                data = in_file.read((last_block - first_block + 1) *
+                                    cipher_length)
 
-        private_key_handle.close()
-        return d
+        ciphertexts = (int.from_bytes(data[position:position + cipher_length],
+                                      byteorder='big')
+                       for position in range(0, len(data), cipher_length))
+        blocks = fixed_size_blocks(
+            decrypt_blocks(ciphertexts, n, private_key), size,
+            total_length - first_block * size)
+        offset = first_block * size
+        return b"".join(blocks)[start - offset:end - offset]
 
     except FileNotFoundError:
-        print("File private_key.pem was not found.")
+        print("File ", in_path, " was not found.", sep="")
+        return None
+
+    except ValueError:
+        return None
+
+
+def read_binary_header(in_file, n):
+    """ Function: read_binary_header
+        Parameters: in_file (binary file object) (at the start of the file)
+                    n       (int)
+        Returns: length, size, total_length (ints), as passed to
+                 encrypt.pack_binary_header
+        Notes: Raises ValueError as check_binary_header does.
+    """
+    header = in_file.read(encrypt.BINARY_HEADER_SIZE)
+    return check_binary_header(header, n, os.fstat(in_file.fileno()).st_size)
+
+
+def check_binary_header(header, n, data_size):
+    """ Function: check_binary_header
+        Parameters: header    (bytes or memoryview) (start of the data)
+                    n         (int)
+                    data_size (int) (bytes of ciphertext, header included)
+        Returns: length, size, total_length (ints), as passed to
+                 encrypt.pack_binary_header
+        Notes: Raises ValueError if the header was written under another
+               key, or if the data does not hold exactly the blocks the
+               header describes.
+    """
+    length, size, total_length = encrypt.unpack_binary_header(header)
+    if length != (n.bit_length() + 7) // 8 or size != encrypt.block_size(n):
+        raise ValueError("ciphertext was made with another key")
+    block_count = -(-total_length // size)  # ceiling
+    if data_size != encrypt.BINARY_HEADER_SIZE + block_count * length:
+        raise ValueError("ciphertext is truncated")
+    return length, size, total_length
+
+
+def decrypt_bytes(data, key, workers=1, chunk_size=None):
+    """ Function: decrypt_bytes
+        Parameters: data       (bytes) (as returned by encrypt.encrypt_bytes)
+                    key        ((n, private_key) tuple)
+                    workers    (int) (processes used for the exponentiations)
+                    chunk_size (int) (blocks per worker task, or None
+                                      for parallel.DEFAULT_CHUNK_SIZE)
+        Returns: plaintext (bytes), or None on failure
+        Notes: In-memory counterpart of decrypt_binary.
+    """
+    n, private_key = key
+    view = memoryview(data)
+    try:  # failsafe for unacceptable or corrupted ciphertext.
+        length, size, total_length = check_binary_header(view, n, len(view))
+        ciphertexts = (int.from_bytes(view[position:position + length],
+                                      byteorder='big')
+                       for position in range(encrypt.BINARY_HEADER_SIZE,
+                                             len(view), length))
+        return b"".join(fixed_size_blocks(
+            decrypt_blocks(ciphertexts, n, private_key, workers, chunk_size),
+            size, total_length))
+    except ValueError:
+        return None
+
+
+def fixed_size_blocks(blocks, size, total_length):
+    """ Function: fixed_size_blocks (generator)
+        Parameters: blocks       (iterable of bytes) (from decrypt_blocks)
+                    size         (int) (input bytes per block)
+                    total_length (int) (input bytes in all)
+        Yields: each block (bytes)
+        Notes: Checks every block against the length given by the header;
+               the last block holds whatever remains of total_length.
+               Raises ValueError on a block of any other length.
+    """
+    remaining = total_length
+    for block in blocks:
+        block_length = min(size, remaining)
+        if len(block) != block_length:
+            raise ValueError("block does not match the header")
+        yield block
+        remaining -= block_length
+
+
+def read_ciphertext_blocks(
+        file_handle, end_banner="-----END PACKED ENCRYPTED MESSAGE-----"):
+    """ Function: read_ciphertext_blocks (generator)
+        Parameters: file_handle (str) (positioned after the opening banner)
+                    end_banner  (str)
+        Yields: ciphertext of each block (int)
+        Notes: Reads one line at a time up to the closing banner.
+    """
+    while True:
+        with metrics.timer("decrypt.io"):
+            line = file_handle.readline()
+        if not line:
+            break
+        line = line.strip()
+        if line == end_banner:
+            break
+        with metrics.timer("decrypt.conversion"):
+            ciphertext = decode_block(line)
+        yield ciphertext
+
+
+def decode_block(line):
+    """ Function: decode_block
+        Parameter: line (str)
+        Returns: value of the block (int)
+        Notes: Reads lines written by encrypt.encode_block, and the legacy
+               b'...' lines of url-safe base64 little-endian bytes.
+    """
+    if line.startswith("b'"):
+        return Keygen.RSAKey.base64_to_int(line)
+    return int.from_bytes(base64.b64decode(line, validate=True),
+                          byteorder='big')
+
+
+def read_hybrid_chunks(file_handle, n, private_key):
+    """ Function: read_hybrid_chunks (generator)
+        Parameters: file_handle (str) (positioned after the opening banner)
+                    n           (int)
+                    private_key (dict)
+        Yields: plaintext bytes of each stream-cipher chunk (bytes)
+        Notes: Unwraps the session key with RSA, then decrypts one line at
+               a time with read_stream_chunks.
+    """
+    wrapped_key = file_handle.readline().strip()
+    session_key = unwrap_session_key(wrapped_key, n, private_key)
+    yield from read_stream_chunks(file_handle, session_key,
+                                  "-----END HYBRID ENCRYPTED MESSAGE-----")
 
-    except PermissionError:
-        print("Permission denied for private_key.pem.", sep="")
+
+def read_multi_chunks(file_handle, n, private_key):
+    """ Function: read_multi_chunks (generator)
+        Parameters: file_handle (str) (positioned after the opening banner)
+                    n           (int)
+                    private_key (dict)
+        Yields: plaintext bytes of each stream-cipher chunk (bytes)
+        Notes: Reads the recipient lines written by encrypt.encrypt_multi
+               and unwraps only the session key listed under the
+               fingerprint of n. Raises ValueError if there is none.
+    """
+    own_fingerprint = keyring.fingerprint(n)
+    wrapped_key = None
+    for recipient in range(int(file_handle.readline())):
+        key_fingerprint, recipient_key = file_handle.readline().split()
+        if key_fingerprint == own_fingerprint:
+            wrapped_key = recipient_key
+    if wrapped_key is None:
+        print("The message was not encrypted for this key.")
+        raise ValueError("no session key for this key")
+
+    session_key = unwrap_session_key(wrapped_key, n, private_key)
+    yield from read_stream_chunks(
+        file_handle, session_key,
+        "-----END MULTI-RECIPIENT ENCRYPTED MESSAGE-----")
+
+
+def unwrap_session_key(wrapped_key, n, private_key):
+    """ Function: unwrap_session_key
+        Parameters: wrapped_key (str) (base64 block)
+                    n           (int)
+                    private_key (dict)
+        Returns: session_key (bytes)
+        Notes: Raises ValueError if the result cannot be a session key,
+               which means it was wrapped under another key.
+    """
+    session_key_int = decrypt_int(decode_block(wrapped_key), n, private_key)
+    if session_key_int.bit_length() > encrypt.SESSION_KEY_SIZE * 8:
+        raise ValueError("session key does not match the private key")
+    return session_key_int.to_bytes(encrypt.SESSION_KEY_SIZE,
+                                    byteorder='big')
+
+
+def read_stream_chunks(file_handle, session_key, end_banner):
+    """ Function: read_stream_chunks (generator)
+        Parameters: file_handle (str) (positioned at the first chunk)
+                    session_key (bytes)
+                    end_banner  (str)
+        Yields: plaintext bytes of each stream-cipher chunk (bytes)
+        Notes: The last line before end_banner is the MAC tag; ValueError
+               is raised once it is reached if it does not match the
+               ciphertext. Chunks are yielded before the tag is checked,
+               so callers must not keep the output unless it is.
+    """
+    stream_key, mac_key = encrypt.derive_session_keys(session_key)
+    mac = hmac.new(mac_key, digestmod=hashlib.sha256)
+
+    # Holds one line back, since the line before the banner is the tag.
+    index = 0
+    previous = None
+    while True:
+        with metrics.timer("decrypt.io"):
+            line = file_handle.readline()
+        if not line:
+            break
+        line = line.strip()
+        if line == end_banner:
+            break
+        if previous is not None:
+            with metrics.timer("decrypt.conversion"):
+                cipher_chunk = base64.b64decode(previous, validate=True)
+            with metrics.timer("decrypt.stream_cipher"):
+                encrypt.update_stream_mac(mac, index, cipher_chunk)
+                chunk = encrypt.keystream_xor(stream_key, index,
+                                              cipher_chunk)
+            yield chunk
+            index += 1
+        previous = line
+
+    if previous is None or \
+            not hmac.compare_digest(mac.hexdigest(), previous):
+        raise ValueError("authentication tag mismatch")
+
+
+def decrypt_blocks(ciphertexts, n, private_key, workers=1,
+                   chunk_size=None, packed=True):
+    """ Function: decrypt_blocks (generator)
+        Parameters: ciphertexts (iterable of ints)
+                    n           (int)
+                    private_key (dict)
+                    workers     (int) (processes used for the exponentiations)
+                    chunk_size  (int) (blocks per worker task, or None
+                                  for parallel.DEFAULT_CHUNK_SIZE)
+                    packed      (bool) (False for legacy blocks without
+                                        encrypt.PACKING_MARKER)
+        Yields: plaintext bytes of each block, in order (bytes)
+    """
+    to_bytes = unpack_block if packed else int_to_bytes
+    if workers > 1:
+        values = parallel.decrypt_ints(ciphertexts, n, private_key, workers,
+                                       chunk_size)
+        # time spent waiting on the workers, so it includes the reading
+        # and conversion of the blocks they are handed.
+        while True:
+            with metrics.timer("decrypt.exponentiation"):
+                m = next(values, None)
+            if m is None:
+                return
+            with metrics.timer("decrypt.conversion"):
+                block = to_bytes(m)
+            yield block
+    else:
+        decryptor = make_decryptor(n, private_key)
+        for ciphertext in ciphertexts:
+            with metrics.timer("decrypt.exponentiation"):
+                m = decryptor(ciphertext)  # decrypt
+            with metrics.timer("decrypt.conversion"):
+                block = to_bytes(m)
+            yield block
+
+
+def decrypt_many(ciphertexts, private_key_path=Keygen.PRIVATE_KEY_PATH,
+                 public_key_path=Keygen.PUBLIC_KEY_PATH, workers=1,
+                 chunk_size=None):
+    """ Function: decrypt_many
+        Parameters: ciphertexts      (iterable of ints, all under one key)
+                    private_key_path (str)
+                    public_key_path  (str) (only read for legacy key files)
+                    workers          (int) (processes used, for large
+                                            batches)
+                    chunk_size       (int) (ciphertexts per worker task, or
+                                            None for
+                                            parallel.DEFAULT_CHUNK_SIZE)
+        Returns: plaintexts (list of ints, in input order) and a report
+                 (dict containing ["count"], ["seconds"], ["per_second"]
+                 and ["key_load_seconds"]), or None if the key files could
+                 not be read
+        Notes: Batch form of decrypt_int. The key is loaded once, and the
+               CRT values and exponentiation engines are resolved once for
+               the whole batch rather than per ciphertext.
+    """
+    start_time = time.perf_counter()
+    key = get_key_pair(private_key_path, public_key_path)
+    if key is None:
+        return None
+    n, private_key = key["n"], key["private_key"]
+    key_load_seconds = time.perf_counter() - start_time
+
+    if workers > 1:
+        plaintexts = list(parallel.decrypt_ints(ciphertexts, n, private_key,
+                                                workers, chunk_size))
+    else:
+        decryptor = make_decryptor(n, private_key)
+        plaintexts = [decryptor(ciphertext) for ciphertext in ciphertexts]
+
+    seconds = time.perf_counter() - start_time
+    report = {"count": len(plaintexts), "seconds": seconds,
+              "per_second": len(plaintexts) / seconds if seconds else 0.0,
+              "key_load_seconds": key_load_seconds}
+    return plaintexts, report
+
+
+def make_decryptor(n, private_key):
+    """ Function: make_decryptor
+        Parameters: n           (int)
+                    private_key (dict, as returned by get_private_key)
+        Returns: function of a ciphertext (int) returning its plaintext
+                 (int)
+        Notes: Same result as decrypt_int, with the key values and the
+               exponentiation engines for p and q looked up once, so they
+               stay hot across a batch of ciphertexts.
+    """
+    if "q_inv" in private_key:
+        p, q = private_key["p"], private_key["q"]
+        d_p, d_q = private_key["d_p"], private_key["d_q"]
+        q_inv = private_key["q_inv"]
+        exp_p = modexp.exp_function(p)
+        exp_q = modexp.exp_function(q)
+        # further primes of a multi-prime key, with the product of the
+        # primes before each one.
+        others = []
+        product = p * q
+        for r, d_r, t in private_key.get("other_primes", ()):
+            others.append((r, d_r, t, product, modexp.exp_function(r)))
+            product *= r
+
+        def decryptor(ciphertext):
+            # Garner's recombination, as in RSAKey.exp_mod_crt.
+            m_p = exp_p(ciphertext % p, d_p)
+            m_q = exp_q(ciphertext % q, d_q)
+            m = m_q + (q_inv * (m_p - m_q) % p) * q
+            for r, d_r, t, before, exp_r in others:
+                m += before * ((exp_r(ciphertext % r, d_r) - m) * t % r)
+            return m
+    else:
+        d = private_key["d"]
+        exp_n = modexp.exp_function(n)
+
+        def decryptor(ciphertext):
+            return exp_n(ciphertext, d)
+
+    return decryptor
+
+
+def export_plaintext(blocks, out_path=DECRYPTED_PATH):
+    """ Function: export_plaintext
+        Parameters: blocks   (iterable of bytes)
+                    out_path (str)
+        Returns: None
+        Notes: Writes the decrypted text to out_path, enclosed in banners.
+               An incremental decoder joins utf-8 characters that were
+               split across block boundaries. The text goes to a partial
+               file that is renamed to out_path only once every block has
+               been read, so a ciphertext that fails its MAC or a block
+               check part way through leaves no plaintext behind.
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    partial_path = out_path + PARTIAL_SUFFIX
+    try:
+        with open(partial_path, "w") as out_file:
+            out_file.write("-----BEGIN DECRYPTED MESSAGE-----\n")
+            for block in blocks:
+                with metrics.timer("decrypt.conversion"):
+                    text = decoder.decode(block)
+                with metrics.timer("decrypt.io"):
+                    out_file.write(text)
+            out_file.write(decoder.decode(b"", final=True))
+            out_file.write("\n-----END DECRYPTED MESSAGE-----")
+        os.replace(partial_path, out_path)
+    except BaseException:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+
+
+def decrypt_int(ciphertext, n, private_key):
+    """ Function: decrypt_int
+        Parameters: ciphertext  (int)
+                    n           (int)
+                    private_key (dict, as returned by get_private_key)
+        Returns: m (int)
+        Notes: Uses the CRT fast path when the private key carries the
+               CRT parameters. Falls back to a full-width exponentiation
+               with d for legacy key files that only hold d.
+    """
+    if "q_inv" in private_key:
+        return Keygen.RSAKey.exp_mod_crt(ciphertext,
+                                         private_key["p"], private_key["q"],
+                                         private_key["d_p"],
+                                         private_key["d_q"],
+                                         private_key["q_inv"],
+                                         private_key.get("other_primes",
+                                                         ()))
+    return Keygen.RSAKey.exp_mod(ciphertext, private_key["d"], n)
+
+
+def get_private_key(path=Keygen.PRIVATE_KEY_PATH,
+                    public_key_path=Keygen.PUBLIC_KEY_PATH):
+    """ Function: get_private_key
+        Parameters: path            (str)
+                    public_key_path (str) (only read for legacy key files)
+        Returns: private_key (dict containing ["d"], and ["p"], ["q"],
+                 ["d_p"], ["d_q"], ["q_inv"] and ["other_primes"] if
+                 present in the file)
+        Notes: Parses private_key.pem for the decryption exponent (d) and
+               the CRT parameters. Legacy key files hold d only.
+    """
+    key = get_key_pair(path, public_key_path)
+    if key is not None:
+        return key["private_key"]
+
+
+def get_key_pair(path=Keygen.PRIVATE_KEY_PATH,
+                 public_key_path=Keygen.PUBLIC_KEY_PATH):
+    """ Function: get_key_pair
+        Parameters: path            (str)
+                    public_key_path (str) (only read for legacy key files)
+        Returns: keyring entry (dict containing ["n"] and ["private_key"]),
+                 or None if the key files could not be read
+        Notes: Parsed keys are cached in the keyring, so the files are
+               only parsed again once they change.
+    """
+    try:  # defensive measure to check file validity for private_key.pem
+        return keyring.DEFAULT_KEYRING.load_private_key(path,
+                                                        public_key_path)
+
+    except FileNotFoundError as error:
+        print("File ", error.filename, " was not found.", sep="")
+
+    except PermissionError as error:
+        print("Permission denied for ", error.filename, ".", sep="")
 
     except IOError:
-        print("Error occurred while reading private_key.pem.", sep="")
+        print("Error occurred while reading ", path, ".", sep="")
 
 
 def int_to_str(data_int):
@@ -74,15 +642,39 @@ def int_to_str(data_int):
         Notes: Discussion on data type conversions for RSA found at link:
                https://crypto.stackexchange.com/questions/42344/convert-plain-text-as-numbers-to-encrypt-using-rsa
     """
-    # converts int to base64
-    data_b64 = Keygen.RSAKey.int_to_base64(data_int)
-    # decodes base64 to byte value
-    data_bytes = base64.urlsafe_b64decode(data_b64)
+    data_bytes = int_to_bytes(data_int)
     # decodes bytes to string value
     decrypted_text = data_bytes.decode(errors='replace')
     return decrypted_text
 
 
+def unpack_block(data_int):
+    """ Function: unpack_block
+        Parameter: data_int (int) (decrypted packed block)
+        Returns: data_bytes (bytes)
+        Notes: Reverses encrypt.pack_block: the highest byte must be
+               encrypt.PACKING_MARKER, and everything below it is the
+               block. Raises ValueError otherwise, which means the block
+               was not encrypted under this key.
+    """
+    data_bytes = int_to_bytes(data_int)
+    if not data_bytes or data_bytes[-1] != encrypt.PACKING_MARKER:
+        raise ValueError("block does not match the private key")
+    return data_bytes[:-1]
+
+
+def int_to_bytes(data_int):
+    """ Function: int_to_bytes
+        Parameter: data_int (int)
+        Returns: data_bytes (bytes)
+        Notes: Byte-level half of int_to_str, used on each block.
+    """
+    # converts int straight to its little-endian byte value, without the
+    # base64 round trip.
+    return data_int.to_bytes((data_int.bit_length() + 7) // 8,
+                             byteorder='little')
+
+
 def main():
     file_name = input("\nEnter the file to decrypt: ")
 
@@ -118,4 +710,7 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    if "--profile" in sys.argv[1:]:
+        metrics.profile(main)
+    else:
+        main()
@@ -4,66 +4,362 @@
 """
 
 import Keygen
+import keyring
+import metrics
+import parallel
 import base64
-import math
+import hashlib
+import hmac
+import mmap
+import os
+import secrets
+import sys
 
 
-def encrypt(file_handle, key_size):
+CIPHERTEXT_PATH = "files/encrypted.txt"
+READ_CHUNK_SIZE = 8192  # characters read from the plaintext per call
+
+MODE_BLOCK = "block"  # every block is encrypted with RSA
+MODE_HYBRID = "hybrid"  # RSA wraps a session key for a stream cipher
+SESSION_KEY_SIZE = 32  # bytes
+STREAM_CHUNK_SIZE = 65536  # bytes of plaintext per line in hybrid mode
+
+BINARY_CIPHERTEXT_PATH = "files/encrypted.bin"
+BINARY_MAGIC = b"RSB"
+BINARY_VERSION = 1
+BINARY_HEADER_SIZE = len(BINARY_MAGIC) + 13  # version, lengths, total
+WRITE_BUFFER_SIZE = 65536  # bytes collected before each write
+
+# Byte placed above the plaintext of every RSA block, see pack_block.
+PACKING_MARKER = 0x01
+
+
+def encrypt(file_handle, key_size=None, out_path=CIPHERTEXT_PATH,
+            mode=MODE_BLOCK, workers=1, chunk_size=None, public_key=None):
     """ Function: encrypt
         Parameters: file_handle (str)
-                    key_size    (int)
+                    key_size    (int) (size of the key pair to generate)
+                    out_path    (str)
+                    mode        (str) (MODE_BLOCK or MODE_HYBRID)
+                    workers     (int) (processes used in block mode)
+                    chunk_size  (int) (blocks per worker task, or None
+                                  for parallel.DEFAULT_CHUNK_SIZE)
+                    public_key  (RSAKey, (n, e) tuple, {"n", "e"} dict or
+                                 path to a public key file, or None)
         Returns: True/False     (bool)
-        Notes: Encrypts a file and exports the cipher into encrypted.txt
+        Notes: Encrypts a file and exports the cipher into encrypted.txt.
+               When public_key is given, the file is encrypted with that key
+               and no key pair is generated. Otherwise a new key pair of
+               key_size is generated and exported to keys/.
+               The file is streamed through in key-sized blocks, so memory
+               use stays flat regardless of the size of the input.
+               In hybrid mode, RSA only encrypts a random session key and
+               the file itself goes through a fast stream cipher.
     """
-    key = Keygen.RSAKey(key_size)  # generates keys
+    if public_key is None:
+        if key_size is None:
+            print("Either a key size or a public key is required.")
+            return False
+
+        key = Keygen.RSAKey(key_size)  # generates keys
+
+        # print statement for demonstration purposes.
+        # Comment out if not needed.
+        print("\n", key, "\n", sep="")
+
+        public_key = Keygen.PUBLIC_KEY_PATH
+
+    public_key = resolve_public_key(public_key)
+    if public_key is None:
+        return False  # key file could not be read
+    n, e = public_key
+
+    if mode == MODE_HYBRID:
+        return export_hybrid(file_handle, n, e, out_path)
+
+    # Splits the text into blocks small enough to be encrypted under n,
+    # encrypts each block and writes them out as they are produced.
+    blocks = read_blocks(file_handle, block_size(n))
+    ciphertexts = encrypt_blocks(blocks, n, e, workers, chunk_size)
+
+    try:
+        # writes ciphertext blocks to encrypted.txt
+        return export_ciphertext_blocks(ciphertexts, out_path,
+                                        (n.bit_length() + 7) // 8)
+    except ValueError:
+        return False  # a block overflowed the key size
+
+
+def encrypt_binary(in_path, out_path=BINARY_CIPHERTEXT_PATH,
+                   public_key=Keygen.PUBLIC_KEY_PATH, workers=1,
+                   chunk_size=None):
+    """ Function: encrypt_binary
+        Parameters: in_path    (str) (any file, read as bytes)
+                    out_path   (str)
+                    public_key (as for encrypt, but not None)
+                    workers    (int) (processes used for the exponentiations)
+                    chunk_size (int) (blocks per worker task, or None
+                                  for parallel.DEFAULT_CHUNK_SIZE)
+        Returns: True/False (bool)
+        Notes: Binary counterpart of encrypt. The input is memory-mapped
+               and each block is packed into an int straight from a
+               memoryview slice of the mapping, without copying it.
+               The output is a header (see pack_binary_header) followed by
+               one fixed-width big-endian ciphertext per block, written in
+               WRITE_BUFFER_SIZE batches.
+    """
+    public_key = resolve_public_key(public_key)
+    if public_key is None:
+        return False  # key file could not be read
+    n, e = public_key
+    length = (n.bit_length() + 7) // 8
+    size = block_size(n)
 
-    # print statement for demonstration purposes. Comment out if not needed.
-    print("\n", key, "\n", sep="")
+    try:  # defensive try block to check file validity
+        with open(in_path, "rb") as in_file, open(out_path, "wb") as out_file:
+            total_length = os.fstat(in_file.fileno()).st_size
+            out_file.write(pack_binary_header(length, size, total_length))
+            if total_length == 0:
+                return True  # an empty file cannot be mapped.
+
+            # the view is released before the mapping is closed, even if
+            # a block fails, or closing the mapping raises BufferError.
+            with mmap.mmap(in_file.fileno(), 0,
+                           access=mmap.ACCESS_READ) as mapped, \
+                    memoryview(mapped) as view:
+                blocks = (view[offset:offset + size]
+                          for offset in range(0, total_length, size))
+                ciphertexts = encrypt_blocks(blocks, n, e, workers,
+                                             chunk_size)
+                write_buffered(out_file,
+                               (ciphertext.to_bytes(length, byteorder='big')
+                                for ciphertext in ciphertexts))
+        return True
 
-    n, e = get_public_key()  # retrieves public key from private_key.txt
+    except FileNotFoundError as error:
+        print("File ", error.filename, " was not found.", sep="")
+        return False
 
-    data = file_handle.read()  # reads the text to be encrypted into a string
-    data_numeric = str_to_int(data)  # converts text to int value
+    except PermissionError:
+        print("Permission denied for ", in_path, " or ", out_path, ".",
+              sep="")
+        return False
 
-    # Check whether bit_size of data_numeric is larger than key_size.
-    # Return False if larger than key_size, as decryption will result in
-    # scrambled text due to overflow.
-    if is_oversized(data_numeric, key_size):
+    except IOError:
+        print("Error occurred while encrypting ", in_path, ".", sep="")
         return False
 
-    ciphertext = Keygen.RSAKey.exp_mod_iter(data_numeric, e, n)  # encrypt
 
-    if export_ciphertext(ciphertext):  # writes ciphertext to encrypted.txt
-        return True  # if export successful, return True
+def encrypt_bytes(data, public_key, workers=1, chunk_size=None):
+    """ Function: encrypt_bytes
+        Parameters: data       (bytes)
+                    public_key (as for encrypt, but not None)
+                    workers    (int) (processes used for the exponentiations)
+                    chunk_size (int) (blocks per worker task, or None
+                                      for parallel.DEFAULT_CHUNK_SIZE)
+        Returns: ciphertext in the format of encrypt_binary (bytes), or
+                 None if the key file could not be read
+        Notes: In-memory counterpart of encrypt_binary, for callers such
+               as daemon that hold the data already.
+    """
+    public_key = resolve_public_key(public_key)
+    if public_key is None:
+        return None
+    n, e = public_key
+    length = (n.bit_length() + 7) // 8
+    size = block_size(n)
+    view = memoryview(data)
+    blocks = (view[offset:offset + size]
+              for offset in range(0, len(view), size))
+    ciphertexts = encrypt_blocks(blocks, n, e, workers, chunk_size)
+    return pack_binary_header(length, size, len(view)) + \
+        b"".join(ciphertext.to_bytes(length, byteorder='big')
+                 for ciphertext in ciphertexts)
+
+
+def pack_binary_header(length, size, total_length):
+    """ Function: pack_binary_header
+        Parameters: length       (int) (byte length of n)
+                    size         (int) (input bytes per block)
+                    total_length (int) (input bytes in all)
+        Returns: header of the binary format (bytes)
+        Notes: Format: BINARY_MAGIC, a version byte, the modulus byte
+               length and block payload size as 2-byte big-endian ints,
+               and the total input length as an 8-byte big-endian int.
+    """
+    return BINARY_MAGIC + bytes([BINARY_VERSION]) + \
+        length.to_bytes(2, byteorder='big') + \
+        size.to_bytes(2, byteorder='big') + \
+        total_length.to_bytes(8, byteorder='big')
+
+
+def unpack_binary_header(data):
+    """ Function: unpack_binary_header
+        Parameter: data (bytes or memoryview) (start of a binary file)
+        Returns: length, size, total_length (ints), as passed to
+                 pack_binary_header
+        Notes: Raises ValueError if data does not start with a header of
+               this version.
+    """
+    if len(data) < BINARY_HEADER_SIZE or \
+            bytes(data[:len(BINARY_MAGIC)]) != BINARY_MAGIC:
+        raise ValueError("not in the binary ciphertext format")
+    position = len(BINARY_MAGIC)
+    if data[position] != BINARY_VERSION:
+        raise ValueError("unsupported binary ciphertext version")
+    length = int.from_bytes(data[position + 1:position + 3], byteorder='big')
+    size = int.from_bytes(data[position + 3:position + 5], byteorder='big')
+    total_length = int.from_bytes(data[position + 5:position + 13],
+                                  byteorder='big')
+    return length, size, total_length
+
+
+def write_buffered(out_file, chunks):
+    """ Function: write_buffered
+        Parameters: out_file (binary file object)
+                    chunks   (iterable of bytes)
+        Returns: None
+        Notes: Collects the chunks and writes them WRITE_BUFFER_SIZE bytes
+               at a time, rather than one small write per block.
+    """
+    buffer = bytearray()
+    for chunk in chunks:
+        buffer += chunk
+        if len(buffer) >= WRITE_BUFFER_SIZE:
+            with metrics.timer("encrypt.io"):
+                out_file.write(buffer)
+            buffer.clear()
+    if buffer:
+        with metrics.timer("encrypt.io"):
+            out_file.write(buffer)
+
+
+def block_size(n):
+    """ Function: block_size
+        Parameter: n (int)
+        Returns: number of plaintext bytes per block (int)
+        Notes: (n.bit_length() - 1) // 8 whole bytes always stay below n;
+               pack_block takes one of them for its marker byte. This
+               fills the modulus, where the old base64-sized blocks left
+               about a quarter of it unused.
+    """
+    return (n.bit_length() - 1) // 8 - 1
+
+
+def read_blocks(file_handle, size):
+    """ Function: read_blocks (generator)
+        Parameters: file_handle (str)
+                    size        (int)
+        Yields: utf-8 encoded blocks of the file of at most size bytes
+        Notes: Only READ_CHUNK_SIZE characters are held in memory at once.
+    """
+    buffer = bytearray()
+    with metrics.timer("encrypt.io"):
+        data = file_handle.read(READ_CHUNK_SIZE)
+    while data:
+        buffer += data.encode('utf-8')
+        while len(buffer) >= size:
+            yield bytes(buffer[:size])
+            del buffer[:size]
+        with metrics.timer("encrypt.io"):
+            data = file_handle.read(READ_CHUNK_SIZE)
+    if buffer:
+        yield bytes(buffer)
+
+
+def encrypt_blocks(blocks, n, e, workers=1, chunk_size=None):
+    """ Function: encrypt_blocks (generator)
+        Parameters: blocks     (iterable of bytes) (at most block_size(n)
+                                                    bytes each)
+                    n, e       (ints)
+                    workers    (int) (processes used for the exponentiations)
+                    chunk_size (int) (blocks per worker task, or None
+                                  for parallel.DEFAULT_CHUNK_SIZE)
+        Yields: ciphertext of each block, in order (int)
+        Notes: Raises ValueError if a block does not fit under n, as
+               decryption would result in scrambled text due to overflow.
+    """
+    values = block_values(blocks, n)
+    if workers > 1:
+        ciphertexts = parallel.encrypt_ints(values, n, e, workers,
+                                            chunk_size)
+        # time spent waiting on the workers, so it includes the reading
+        # and conversion of the blocks they are handed.
+        while True:
+            with metrics.timer("encrypt.exponentiation"):
+                ciphertext = next(ciphertexts, None)
+            if ciphertext is None:
+                return
+            yield ciphertext
     else:
-        return False  # if export failed, return False
+        for data_numeric in values:
+            with metrics.timer("encrypt.exponentiation"):
+                ciphertext = Keygen.RSAKey.exp_mod(data_numeric, e, n)
+            yield ciphertext  # encrypted block
+
+
+def block_values(blocks, n):
+    """ Function: block_values (generator)
+        Parameters: blocks (iterable of bytes)
+                    n      (int)
+        Yields: packed value of each block (int)
+    """
+    for block in blocks:
+        with metrics.timer("encrypt.conversion"):
+            data_numeric = pack_block(block)  # converts block to int value
+        if is_oversized(data_numeric, n):
+            raise ValueError("block is larger than the modulus")
+        yield data_numeric
+
+
+def pack_block(block):
+    """ Function: pack_block
+        Parameter: block (bytes or memoryview)
+        Returns: value of the block with PACKING_MARKER above it (int)
+        Notes: The block's bytes are the little-endian low bytes of the
+               value and the marker byte sits just above them, so zero
+               bytes anywhere in the block, including at its end, survive
+               the trip through an int. decrypt.unpack_block reverses it.
+    """
+    return bytes_to_int(block) | (PACKING_MARKER << (8 * len(block)))
 
 
-def get_public_key():
+def resolve_public_key(public_key):
+    """ Function: resolve_public_key
+        Parameter: public_key (RSAKey, (n, e) tuple, {"n", "e"} dict or
+                               path to a public key file)
+        Returns: n, e (ints), or None if the key file could not be read
+    """
+    if isinstance(public_key, Keygen.RSAKey):
+        public_key = public_key.get_public_key()
+    if isinstance(public_key, dict):
+        return public_key["n"], public_key["e"]
+    if isinstance(public_key, str):
+        return get_public_key(public_key)
+    n, e = public_key
+    return n, e
+
+
+def get_public_key(path=Keygen.PUBLIC_KEY_PATH):
     """ Function: get_public_key
-        Parameters: None
+        Parameters: path (str)
         Returns: n, e (ints)
         Notes: Parses public_key.pem for the modulus (n) and encryption
-               exponent (e)
+               exponent (e). Parsed keys are cached in the keyring, so the
+               file is only parsed again once it changes.
     """
     try:  # defensive measure to check file validity for public_key.pem
-        public_key_handle = open("keys/public_key.pem", "r")
-        public_key = public_key_handle.read().split("\n")
-
-        n = Keygen.RSAKey.base64_to_int(public_key[1])
-        e = Keygen.RSAKey.base64_to_int(public_key[2])
-
-        public_key_handle.close()
-        return n, e
+        entry = keyring.DEFAULT_KEYRING.load_public_key(path)
+        return entry["n"], entry["e"]
 
     except FileNotFoundError:
-        print("File public_key.pem was not found.")
+        print("File ", path, " was not found.", sep="")
 
     except PermissionError:
-        print("Permission denied for public_key.pem.", sep="")
+        print("Permission denied for ", path, ".", sep="")
 
     except IOError:
-        print("Error occurred while reading public_key.pem.", sep="")
+        print("Error occurred while reading ", path, ".", sep="")
 
 
 def str_to_int(data_str):
@@ -76,10 +372,18 @@ def str_to_int(data_str):
     """
     # converts string to utf-8 value
     data_bytes = data_str.encode('utf-8')
-    # converts utf-8 value to base64 encoding
-    data_b64 = base64.urlsafe_b64encode(data_bytes)
-    # passes in string of base64 value and converts to int value
-    data_numeric = Keygen.RSAKey.base64_to_int(str(data_b64))
+    return bytes_to_int(data_bytes)
+
+
+def bytes_to_int(data_bytes):
+    """ Function: bytes_to_int
+        Parameters: data_bytes (bytes)
+        Returns: data_numeric (int)
+        Note: Byte-level half of str_to_int, used on each block.
+    """
+    # the base64 round trip of the old str() / literal_eval conversion
+    # gave back the same bytes, so they convert straight to an int value.
+    data_numeric = int.from_bytes(data_bytes, byteorder='little')
     return data_numeric
 
 
@@ -87,42 +391,232 @@ def export_ciphertext(ciphertext):
     """ Function: export_ciphertext
         Parameter: ciphertext (int)
         Returns: True/False (bool)
-        Notes: Writes ciphertext to encrypted.txt. If failed due to
-               exceptions, return False. Otherwise, return True.
+        Notes: Writes a single-block ciphertext to encrypted.txt. If failed
+               due to exceptions, return False. Otherwise, return True.
+    """
+    return export_ciphertext_blocks([ciphertext])
+
+
+def export_ciphertext_blocks(ciphertexts, out_path=CIPHERTEXT_PATH,
+                             length=None):
+    """ Function: export_ciphertext_blocks
+        Parameters: ciphertexts (iterable of ints)
+                    out_path    (str)
+                    length      (int) (byte length of n, or None)
+        Returns: True/False (bool)
+        Notes: Writes each ciphertext block to out_path on its own line,
+               enclosed in banners, as the blocks are produced. If failed
+               due to exceptions, return False. Otherwise, return True.
+    """
+    try:  # defensive try block to check file validity
+        with open(out_path, "w") as out_file:
+            out_file.write("-----BEGIN PACKED ENCRYPTED MESSAGE-----\n")
+            for ciphertext in ciphertexts:
+                with metrics.timer("encrypt.conversion"):
+                    line = encode_block(ciphertext, length) + "\n"
+                with metrics.timer("encrypt.io"):
+                    out_file.write(line)
+            out_file.write("-----END PACKED ENCRYPTED MESSAGE-----")
+        return True
+
+    except PermissionError:
+        print("Permission denied for ", out_path, ".", sep="")
+        return False
+
+    except IOError:
+        print("Error occurred while writing to ", out_path, ".", sep="")
+        return False
+
+
+def encode_block(value, length=None):
+    """ Function: encode_block
+        Parameters: value  (int)
+                    length (int) (byte length of n, or None for the
+                                  shortest encoding of value)
+        Returns: value as standard base64 of its big-endian bytes (str)
+        Notes: With length set to the byte length of n, every block line
+               of a file has the same width.
+    """
+    if length is None:
+        length = (value.bit_length() + 7) // 8
+    return base64.b64encode(value.to_bytes(length, byteorder='big')) \
+        .decode('ascii')
+
+
+def export_hybrid(file_handle, n, e, out_path=CIPHERTEXT_PATH):
+    """ Function: export_hybrid
+        Parameters: file_handle (str)
+                    n, e        (ints)
+                    out_path    (str)
+        Returns: True/False (bool)
+        Notes: Writes a hybrid-mode ciphertext to out_path, enclosed in
+               banners: the RSA-wrapped session key, then one base64 line
+               per STREAM_CHUNK_SIZE bytes of stream-cipher output, then an
+               HMAC-SHA256 tag over the ciphertext (encrypt-then-MAC).
+    """
+    session_key = secrets.token_bytes(SESSION_KEY_SIZE)
+
+    # The session key is the only value that goes through RSA.
+    wrapped_key = wrap_session_key(session_key, n, e)
+
+    try:  # defensive try block to check file validity
+        with open(out_path, "w") as out_file:
+            out_file.write("-----BEGIN HYBRID ENCRYPTED MESSAGE-----\n" +
+                           wrapped_key + "\n")
+            write_stream_chunks(out_file, file_handle, session_key)
+            out_file.write("\n-----END HYBRID ENCRYPTED MESSAGE-----")
+        return True
+
+    except PermissionError:
+        print("Permission denied for ", out_path, ".", sep="")
+        return False
+
+    except IOError:
+        print("Error occurred while writing to ", out_path, ".", sep="")
+        return False
+
+
+def encrypt_multi(file_handle, public_keys, out_path=CIPHERTEXT_PATH):
+    """ Function: encrypt_multi
+        Parameters: file_handle (str)
+                    public_keys (list) (each as for encrypt's public_key,
+                                        but not None)
+                    out_path    (str)
+        Returns: True/False (bool)
+        Notes: Encrypts a file once for several recipients. As in hybrid
+               mode, the file goes through the stream cipher under one
+               random session key, which is then wrapped under each
+               recipient's public key and listed by key fingerprint, so
+               each extra recipient costs one RSA exponentiation.
+               Format: banner, the number of recipients, one
+               "fingerprint wrapped key" line per recipient, then the
+               stream-cipher lines and HMAC tag of hybrid mode.
     """
+    recipients = {}
+    for public_key in public_keys:
+        public_key = resolve_public_key(public_key)
+        if public_key is None:
+            return False  # key file could not be read
+        n, e = public_key
+        recipients.setdefault(keyring.fingerprint(n), (n, e))
+    if not recipients:
+        print("At least one public key is required.")
+        return False
+
+    session_key = secrets.token_bytes(SESSION_KEY_SIZE)
     try:  # defensive try block to check file validity
-        out_file = open("files/encrypted.txt", "w")
-        # converts cipher to base64 for storage
-        cipher_base64 = Keygen.RSAKey.int_to_base64(ciphertext)
-        out_file.write("-----BEGIN ENCRYPTED MESSAGE-----\n" +
-                       str(cipher_base64) +
-                       "\n-----END ENCRYPTED MESSAGE-----")
-        out_file.close()
+        with open(out_path, "w") as out_file:
+            out_file.write("-----BEGIN MULTI-RECIPIENT ENCRYPTED MESSAGE-----"
+                           "\n" + str(len(recipients)) + "\n")
+            for key_fingerprint, (n, e) in recipients.items():
+                out_file.write(key_fingerprint + " " +
+                               wrap_session_key(session_key, n, e) + "\n")
+            write_stream_chunks(out_file, file_handle, session_key)
+            out_file.write(
+                "\n-----END MULTI-RECIPIENT ENCRYPTED MESSAGE-----")
         return True
 
     except PermissionError:
-        print("Permission denied for encrypted.txt.", sep="")
+        print("Permission denied for ", out_path, ".", sep="")
         return False
 
     except IOError:
-        print("Error occurred while writing to encrypted.txt.", sep="")
+        print("Error occurred while writing to ", out_path, ".", sep="")
         return False
 
 
-def is_oversized(int_value, key_size):
+def wrap_session_key(session_key, n, e):
+    """ Function: wrap_session_key
+        Parameters: session_key (bytes)
+                    n, e        (ints)
+        Returns: the session key encrypted under (n, e), as a base64 block
+                 the byte length of n (str)
+    """
+    wrapped_key = Keygen.RSAKey.exp_mod(
+        int.from_bytes(session_key, byteorder='big'), e, n)
+    return encode_block(wrapped_key, (n.bit_length() + 7) // 8)
+
+
+def write_stream_chunks(out_file, file_handle, session_key):
+    """ Function: write_stream_chunks
+        Parameters: out_file    (text file object)
+                    file_handle (str)
+                    session_key (bytes)
+        Returns: None
+        Notes: Writes one base64 line per STREAM_CHUNK_SIZE bytes of
+               stream-cipher output, then an HMAC-SHA256 tag over the
+               ciphertext (encrypt-then-MAC), without a final newline.
+    """
+    stream_key, mac_key = derive_session_keys(session_key)
+    mac = hmac.new(mac_key, digestmod=hashlib.sha256)
+    chunks = read_blocks(file_handle, STREAM_CHUNK_SIZE)
+    for index, chunk in enumerate(chunks):
+        with metrics.timer("encrypt.stream_cipher"):
+            cipher_chunk = keystream_xor(stream_key, index, chunk)
+            update_stream_mac(mac, index, cipher_chunk)
+        with metrics.timer("encrypt.conversion"):
+            line = base64.b64encode(cipher_chunk).decode() + "\n"
+        with metrics.timer("encrypt.io"):
+            out_file.write(line)
+    out_file.write(mac.hexdigest())
+
+
+def update_stream_mac(mac, index, cipher_chunk):
+    """ Function: update_stream_mac
+        Parameters: mac          (hmac.HMAC)
+                    index        (int) (position of the chunk in the file)
+                    cipher_chunk (bytes)
+        Returns: None
+        Notes: Each chunk is framed by its index and length before it is
+               added to the MAC. The keystream depends on the index, so
+               without the framing the same ciphertext could be split
+               into lines at other points and still match the tag.
+    """
+    mac.update(index.to_bytes(8, byteorder='big') +
+               len(cipher_chunk).to_bytes(8, byteorder='big'))
+    mac.update(cipher_chunk)
+
+
+def derive_session_keys(session_key):
+    """ Function: derive_session_keys
+        Parameter: session_key (bytes)
+        Returns: stream_key, mac_key (bytes)
+        Notes: Separate keys for the stream cipher and the MAC, so the same
+               secret is never used for two purposes.
+    """
+    stream_key = hashlib.sha256(b"rsa-hybrid-stream" + session_key).digest()
+    mac_key = hashlib.sha256(b"rsa-hybrid-mac" + session_key).digest()
+    return stream_key, mac_key
+
+
+def keystream_xor(stream_key, index, chunk):
+    """ Function: keystream_xor
+        Parameters: stream_key (bytes)
+                    index      (int) (position of the chunk in the file)
+                    chunk      (bytes)
+        Returns: chunk XORed with the keystream for that position (bytes)
+        Notes: The keystream for each chunk is SHAKE-256 of the key and the
+               chunk index, so chunks never share keystream. The same call
+               encrypts and decrypts.
+    """
+    keystream = hashlib.shake_256(
+        stream_key + index.to_bytes(8, byteorder='big')).digest(len(chunk))
+    result = (int.from_bytes(chunk, byteorder='big') ^
+              int.from_bytes(keystream, byteorder='big'))
+    return result.to_bytes(len(chunk), byteorder='big')
+
+
+def is_oversized(int_value, n):
     """ Function: is_oversized
         Parameters: int_value (int)
-                    key_size (int)
+                    n         (int) (modulus)
         Returns: True/False (bool)
-        Notes: If numeric value of text is greater than key_size,
+        Notes: If numeric value of text is not below the modulus,
                return True. Otherwise, return False.
                Function used to check if the size of the text will
                cause an overflow and result in failed decryption.
     """
-    bit_size = math.ceil(int_value.bit_length())
-    if bit_size >= key_size:
-        return True
-    return False
+    return int_value >= n
 
 
 def main():
@@ -133,15 +627,26 @@ def main():
 
         try:  # defensive measure to check file validity.
             file_handle = open(file_name, "r")
-            key_size = int(input("Enter the encryption key size "
-                                 "(1024 or 2048): "))
-            # defensive while block to get key_size from user input.
-            while key_size != 1024 and key_size != 2048:
-                print("Invalid key size. Please enter 1024 or 2048.")
+            # an existing public key skips key generation entirely.
+            public_key = input("Enter the public key file (leave blank to "
+                               "generate a new key pair): ") or None
+            key_size = None
+            if public_key is None:
                 key_size = int(input("Enter the encryption key size "
                                      "(1024 or 2048): "))
+                # defensive while block to get key_size from user input.
+                while key_size != 1024 and key_size != 2048:
+                    print("Invalid key size. Please enter 1024 or 2048.")
+                    key_size = int(input("Enter the encryption key size "
+                                         "(1024 or 2048): "))
+            mode = input("Enter the encryption mode (block or hybrid): ")
+            # defensive while block to get mode from user input.
+            while mode != MODE_BLOCK and mode != MODE_HYBRID:
+                print("Invalid mode. Please enter block or hybrid.")
+                mode = input("Enter the encryption mode (block or hybrid): ")
             # if encryption is successful, print success message.
-            if encrypt(file_handle, key_size):
+            if encrypt(file_handle, key_size, mode=mode,
+                       public_key=public_key):
                 print("File ", file_name, " was successfully encrypted.",
                       sep="")
             else:  # else if encryption fails, print fail message.
@@ -163,4 +668,7 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    if "--profile" in sys.argv[1:]:
+        metrics.profile(main)
+    else:
+        main()
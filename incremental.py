@@ -0,0 +1,382 @@
+""" CS5001-5003, Spring 2022
+    Final Project (incremental module)
+    Norrec Nieh
+"""
+
+import Keygen
+import encrypt
+import decrypt
+import keyring
+import argparse
+import hashlib
+import hmac
+import json
+import mmap
+import os
+import secrets
+import sys
+
+STORE_PATH = "files/store"
+MANIFEST_NAME = "manifest.json"
+CHUNKS_DIRECTORY = "chunks"
+PARTIAL_SUFFIX = ".partial"  # files are renamed into place when complete
+MANIFEST_VERSION = 1
+
+# Content-defined chunk sizes, in bytes. A boundary is cut where the top
+# AVERAGE_CHUNK_BITS bits of the rolling hash are all zero, so chunks
+# average about 2^13 = 8 KiB past MIN_CHUNK_SIZE.
+MIN_CHUNK_SIZE = 2048
+AVERAGE_CHUNK_BITS = 13
+MAX_CHUNK_SIZE = 65536
+BOUNDARY_MASK = ((1 << AVERAGE_CHUNK_BITS) - 1) << (64 - AVERAGE_CHUNK_BITS)
+HASH_MASK = (1 << 64) - 1
+
+# Gear table of the rolling hash: one fixed 64-bit value per byte value.
+# Derived from SHA-256 rather than drawn at random, so boundaries fall in
+# the same places on every run and every machine.
+GEAR = [int.from_bytes(hashlib.sha256(b"rsa-gear" + bytes([value])).digest()
+                       [:8], byteorder='big') for value in range(256)]
+
+
+def encrypt_incremental(in_path, store_path=STORE_PATH,
+                        public_key_path=Keygen.PUBLIC_KEY_PATH,
+                        private_key_path=Keygen.PRIVATE_KEY_PATH):
+    """ Function: encrypt_incremental
+        Parameters: in_path          (str) (any file, read as bytes)
+                    store_path       (str) (directory of the chunk store)
+                    public_key_path  (str)
+                    private_key_path (str) (only read when the store
+                                            already exists)
+        Returns: dict containing ["chunks"], ["new_chunks"], ["new_bytes"]
+                 and ["removed_chunks"], or None on failure
+        Notes: Splits the file into content-defined chunks, so an edit
+               only moves the chunk boundaries around it. Each chunk is
+               stored encrypted under its id, a keyed hash of its
+               plaintext, and the manifest lists the ids in file order.
+               Chunks already in the store are not encrypted or written
+               again, and chunks the new manifest no longer lists are
+               removed afterwards.
+               The store key behind the ids and the stream cipher is
+               random, and wrapped under the public key in the manifest.
+               Later runs unwrap it with the private key, so the ids reveal
+               nothing about the plaintext without it.
+    """
+    manifest_path = os.path.join(store_path, MANIFEST_NAME)
+    if os.path.exists(manifest_path):
+        entry = decrypt.get_key_pair(private_key_path, public_key_path)
+        if entry is None:
+            return None
+        manifest = read_manifest(manifest_path, entry["n"],
+                                 entry["private_key"])
+        if manifest is None:
+            return None
+        store_key = manifest["store_key"]
+        n = entry["n"]
+        wrapped_key = manifest["wrapped_key"]
+    else:
+        public_key = encrypt.get_public_key(public_key_path)
+        if public_key is None:
+            return None
+        n, e = public_key
+        store_key = secrets.token_bytes(encrypt.SESSION_KEY_SIZE)
+        wrapped_key = encrypt.wrap_session_key(store_key, n, e)
+    id_key, stream_key, mac_key = derive_store_keys(store_key)
+
+    chunks = []
+    stats = {"chunks": 0, "new_chunks": 0, "new_bytes": 0,
+             "removed_chunks": 0}
+    try:
+        os.makedirs(os.path.join(store_path, CHUNKS_DIRECTORY), exist_ok=True)
+        with open(in_path, "rb") as in_file:
+            total_length = os.fstat(in_file.fileno()).st_size
+            if total_length > 0:
+                with mmap.mmap(in_file.fileno(), 0,
+                               access=mmap.ACCESS_READ) as mapped:
+                    for start, end in chunk_boundaries(mapped):
+                        chunk = mapped[start:end]
+                        chunk_id = hmac.new(id_key, chunk,
+                                            hashlib.sha256).hexdigest()
+                        chunks.append([chunk_id, len(chunk)])
+                        if write_chunk(store_path, chunk_id, chunk,
+                                       stream_key):
+                            stats["new_chunks"] += 1
+                            stats["new_bytes"] += len(chunk)
+        stats["chunks"] = len(chunks)
+
+        manifest = {"version": MANIFEST_VERSION,
+                    "fingerprint": keyring.fingerprint(n),
+                    "wrapped_key": wrapped_key,
+                    "length": total_length,
+                    "chunks": chunks}
+        manifest["mac"] = manifest_mac(manifest, mac_key)
+        partial_path = manifest_path + PARTIAL_SUFFIX
+        with open(partial_path, "w") as manifest_file:
+            json.dump(manifest, manifest_file)
+        os.replace(partial_path, manifest_path)
+        stats["removed_chunks"] = remove_unlisted_chunks(
+            store_path, set(chunk_id for chunk_id, length in chunks))
+        return stats
+
+    except FileNotFoundError as error:
+        print("File ", error.filename, " was not found.", sep="")
+        return None
+
+    except PermissionError as error:
+        print("Permission denied for ", error.filename, ".", sep="")
+        return None
+
+    except IOError:
+        print("Error occurred while encrypting ", in_path, ".", sep="")
+        return None
+
+
+def decrypt_incremental(store_path=STORE_PATH, out_path=decrypt.DECRYPTED_PATH,
+                        public_key_path=Keygen.PUBLIC_KEY_PATH,
+                        private_key_path=Keygen.PRIVATE_KEY_PATH):
+    """ Function: decrypt_incremental
+        Parameters: store_path       (str)
+                    out_path         (str)
+                    public_key_path  (str)
+                    private_key_path (str)
+        Returns: True/False (bool)
+        Notes: Rebuilds the file from the chunks the manifest lists. Each
+               decrypted chunk must hash back to its id, which
+               authenticates it, and the manifest carries an HMAC. The file
+               is written to a partial file that is renamed to out_path
+               only once every chunk has been read, so a missing or
+               tampered chunk leaves out_path untouched.
+    """
+    entry = decrypt.get_key_pair(private_key_path, public_key_path)
+    if entry is None:
+        return False
+    manifest = read_manifest(os.path.join(store_path, MANIFEST_NAME),
+                             entry["n"], entry["private_key"])
+    if manifest is None:
+        return False
+    id_key, stream_key, mac_key = derive_store_keys(manifest["store_key"])
+
+    partial_path = out_path + PARTIAL_SUFFIX
+    try:
+        with open(partial_path, "wb") as out_file:
+            encrypt.write_buffered(out_file, (
+                read_chunk(store_path, chunk_id, length, id_key, stream_key)
+                for chunk_id, length in manifest["chunks"]))
+        os.replace(partial_path, out_path)
+        return True
+
+    except FileNotFoundError as error:
+        print("File ", error.filename, " was not found.", sep="")
+        return False
+
+    except PermissionError as error:
+        print("Permission denied for ", error.filename, ".", sep="")
+        return False
+
+    except ValueError:
+        print("Chunk store is corrupted or was changed.")
+        return False
+
+    finally:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+
+
+def chunk_boundaries(data):
+    """ Function: chunk_boundaries (generator)
+        Parameter: data (bytes, mmap or memoryview)
+        Yields: (start, end) offsets of each chunk, in order (ints)
+        Notes: Gear rolling hash, as in FastCDC: each byte shifts the hash
+               left and adds its GEAR value, so the top bits depend only
+               on the last 64 bytes. A boundary is cut after a byte that
+               leaves the bits in BOUNDARY_MASK clear, but no sooner than
+               MIN_CHUNK_SIZE and no later than MAX_CHUNK_SIZE bytes into
+               the chunk. The first MIN_CHUNK_SIZE bytes are not hashed.
+    """
+    length = len(data)
+    start = 0
+    while start < length:
+        end = min(start + MAX_CHUNK_SIZE, length)
+        boundary = end
+        rolling_hash = 0
+        for position in range(start + MIN_CHUNK_SIZE, end):
+            rolling_hash = ((rolling_hash << 1) + GEAR[data[position]]) & \
+                HASH_MASK
+            if not rolling_hash & BOUNDARY_MASK:
+                boundary = position + 1
+                break
+        yield start, boundary
+        start = boundary
+
+
+def derive_store_keys(store_key):
+    """ Function: derive_store_keys
+        Parameter: store_key (bytes)
+        Returns: id_key, stream_key, mac_key (bytes)
+        Notes: Separate keys for the chunk ids, the stream cipher and the
+               manifest MAC, as derive_session_keys does in hybrid mode.
+    """
+    id_key = hashlib.sha256(b"rsa-chunk-id" + store_key).digest()
+    stream_key = hashlib.sha256(b"rsa-chunk-stream" + store_key).digest()
+    mac_key = hashlib.sha256(b"rsa-manifest-mac" + store_key).digest()
+    return id_key, stream_key, mac_key
+
+
+def chunk_path(store_path, chunk_id):
+    """ Function: chunk_path
+        Parameters: store_path (str)
+                    chunk_id   (str) (hex)
+        Returns: path of the chunk's file (str)
+        Notes: Chunks are spread over 256 subdirectories by the first two
+               hex digits of their id.
+    """
+    return os.path.join(store_path, CHUNKS_DIRECTORY, chunk_id[:2], chunk_id)
+
+
+def write_chunk(store_path, chunk_id, chunk, stream_key):
+    """ Function: write_chunk
+        Parameters: store_path (str)
+                    chunk_id   (str)
+                    chunk      (bytes) (plaintext)
+                    stream_key (bytes)
+        Returns: True if the chunk was written, False if the store already
+                 held it (bool)
+        Notes: The keystream is keyed by the chunk id, so no two distinct
+               chunks share one. A chunk is written to a partial file and
+               renamed, so a chunk file that exists is always complete.
+    """
+    path = chunk_path(store_path, chunk_id)
+    if os.path.exists(path):
+        return False
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + PARTIAL_SUFFIX, "wb") as chunk_file:
+        chunk_file.write(encrypt.keystream_xor(
+            chunk_stream_key(stream_key, chunk_id), 0, chunk))
+    os.replace(path + PARTIAL_SUFFIX, path)
+    return True
+
+
+def read_chunk(store_path, chunk_id, length, id_key, stream_key):
+    """ Function: read_chunk
+        Parameters: store_path (str)
+                    chunk_id   (str)
+                    length     (int) (plaintext bytes listed for it)
+                    id_key     (bytes)
+                    stream_key (bytes)
+        Returns: plaintext of the chunk (bytes)
+        Notes: Raises ValueError if the chunk does not match its id.
+    """
+    with open(chunk_path(store_path, chunk_id), "rb") as chunk_file:
+        cipher_chunk = chunk_file.read()
+    if len(cipher_chunk) != length:
+        raise ValueError("chunk has the wrong length")
+    chunk = encrypt.keystream_xor(chunk_stream_key(stream_key, chunk_id), 0,
+                                  cipher_chunk)
+    if not hmac.compare_digest(
+            hmac.new(id_key, chunk, hashlib.sha256).hexdigest(), chunk_id):
+        raise ValueError("chunk does not match its id")
+    return chunk
+
+
+def chunk_stream_key(stream_key, chunk_id):
+    """ Function: chunk_stream_key
+        Parameters: stream_key (bytes)
+                    chunk_id   (str)
+        Returns: stream-cipher key of that chunk (bytes)
+    """
+    return hashlib.sha256(stream_key + bytes.fromhex(chunk_id)).digest()
+
+
+def manifest_mac(manifest, mac_key):
+    """ Function: manifest_mac
+        Parameters: manifest (dict) (without ["mac"])
+                    mac_key  (bytes)
+        Returns: hex HMAC-SHA256 of the manifest's canonical JSON (str)
+    """
+    body = json.dumps({name: value for name, value in manifest.items()
+                       if name != "mac"}, sort_keys=True)
+    return hmac.new(mac_key, body.encode(), hashlib.sha256).hexdigest()
+
+
+def read_manifest(path, n, private_key):
+    """ Function: read_manifest
+        Parameters: path        (str)
+                    n           (int)
+                    private_key (dict)
+        Returns: the manifest (dict), with the unwrapped ["store_key"]
+                 (bytes) added, or None on failure
+        Notes: Fails if the store was made with another key, or if the
+               manifest's HMAC does not match.
+    """
+    try:
+        with open(path) as manifest_file:
+            manifest = json.load(manifest_file)
+        if manifest.get("version") != MANIFEST_VERSION:
+            raise ValueError("unsupported manifest version")
+        if manifest["fingerprint"] != keyring.fingerprint(n):
+            print("The store was encrypted with another key.")
+            return None
+        store_key = decrypt.unwrap_session_key(manifest["wrapped_key"], n,
+                                               private_key)
+        mac_key = derive_store_keys(store_key)[2]
+        if not hmac.compare_digest(manifest_mac(manifest, mac_key),
+                                   manifest["mac"]):
+            raise ValueError("manifest MAC mismatch")
+        manifest["store_key"] = store_key
+        return manifest
+
+    except FileNotFoundError:
+        print("File ", path, " was not found.", sep="")
+        return None
+
+    except (KeyError, TypeError, ValueError):
+        print("Manifest ", path, " is corrupted or was changed.", sep="")
+        return None
+
+
+def remove_unlisted_chunks(store_path, chunk_ids):
+    """ Function: remove_unlisted_chunks
+        Parameters: store_path (str)
+                    chunk_ids  (set of str) (chunks to keep)
+        Returns: number of chunk files removed (int)
+        Notes: Also removes partial files left by an interrupted run.
+    """
+    removed = 0
+    for root, directories, files in os.walk(
+            os.path.join(store_path, CHUNKS_DIRECTORY)):
+        for file_name in files:
+            if file_name not in chunk_ids:
+                os.remove(os.path.join(root, file_name))
+                removed += not file_name.endswith(PARTIAL_SUFFIX)
+    return removed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Keep an encrypted chunk store of a file up to date, "
+                    "writing only the chunks that changed.")
+    parser.add_argument("operation", choices=("encrypt", "decrypt"))
+    parser.add_argument("path", help="file to encrypt, or file to write "
+                                     "when decrypting")
+    parser.add_argument("--store", default=STORE_PATH)
+    parser.add_argument("--public-key", default=Keygen.PUBLIC_KEY_PATH)
+    parser.add_argument("--private-key", default=Keygen.PRIVATE_KEY_PATH)
+    args = parser.parse_args()
+
+    if args.operation == "decrypt":
+        if not decrypt_incremental(args.store, args.path, args.public_key,
+                                   args.private_key):
+            sys.exit(1)
+        print("Restored ", args.path, " from ", args.store, ".", sep="")
+        return
+
+    stats = encrypt_incremental(args.path, args.store, args.public_key,
+                                args.private_key)
+    if stats is None:
+        sys.exit(1)
+    print(stats["chunks"], " chunks, ", stats["new_chunks"], " new (",
+          stats["new_bytes"], " bytes), ", stats["removed_chunks"],
+          " removed.", sep="")
+
+
+if __name__ == "__main__":
+    main()
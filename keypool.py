@@ -0,0 +1,176 @@
+""" CS5001-5003, Spring 2022
+    Final Project (keypool module)
+    Norrec Nieh
+"""
+
+import Keygen
+import concurrent.futures
+import queue
+import threading
+import time
+
+
+class KeyPool:
+    """ Class: KeyPool
+        Attributes: __key_size (int)
+                    __prime_count (int)
+                    __capacity (int) (maximum number of ready keys)
+                    __workers (int) (processes searching for primes)
+                    __queue (queue.Queue of ready RSAKey objects)
+                    __executor (ProcessPoolExecutor, while running)
+                    __thread (refill thread, while running)
+                    __stop_event (threading.Event)
+                    __stats (dict of counters reported by metrics)
+        Notes: Keeps a bounded queue of RSAKey objects filled in the
+               background, so callers needing a fresh key can take one
+               without waiting for key generation. The primes of each key
+               are searched for concurrently in separate processes. Pooled
+               keys are not exported; call export_keys on a key to write it
+               to keys/.
+    """
+
+    def __init__(self, key_size, capacity=4, workers=2, prime_count=2):
+        """ Method: __init__ (constructor)
+            Parameters: key_size    (int)
+                        capacity    (int)
+                        workers     (int)
+                        prime_count (int) (primes per key)
+            Returns: None
+            Notes: The pool is filled once start is called.
+        """
+        self.__key_size = key_size
+        self.__prime_count = prime_count
+        self.__capacity = capacity
+        self.__workers = workers
+        self.__queue = queue.Queue(maxsize=capacity)
+        self.__executor = None
+        self.__thread = None
+        self.__stop_event = threading.Event()
+        self.__lock = threading.Lock()
+        self.__stats = {"keys_generated": 0, "keys_served": 0, "misses": 0,
+                        "generation_seconds": 0.0, "started_at": None}
+
+    def start(self):
+        """ KeyPool Method: start (public)
+            Parameters: None
+            Returns: None
+            Notes: Starts the worker processes and the refill thread.
+        """
+        if self.__thread is not None and self.__thread.is_alive():
+            return
+        self.__stop_event.clear()
+        self.__executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.__workers)
+        self.__stats["started_at"] = time.perf_counter()
+        self.__thread = threading.Thread(target=self.__refill, daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        """ KeyPool Method: stop (public)
+            Parameters: None
+            Returns: None
+            Notes: Stops the refill thread and the worker processes. Keys
+                   already in the pool can still be taken with get.
+        """
+        self.__stop_event.set()
+        if self.__executor is not None:
+            self.__executor.shutdown(wait=False, cancel_futures=True)
+        if self.__thread is not None:
+            self.__thread.join()
+        self.__thread = None
+        self.__executor = None
+
+    def get(self, timeout=None):
+        """ KeyPool Method: get (public)
+            Parameter: timeout (float, or None to wait indefinitely)
+            Returns: a fresh RSAKey
+            Notes: Returns immediately when the pool holds a key. Otherwise
+                   waits for the refill thread, or generates a key inline
+                   if the pool is not running. Raises queue.Empty if the
+                   timeout runs out.
+        """
+        try:
+            key = self.__queue.get_nowait()
+        except queue.Empty:
+            with self.__lock:
+                self.__stats["misses"] += 1
+            if self.__thread is None or not self.__thread.is_alive():
+                key = Keygen.RSAKey(self.__key_size, export=False,
+                                    prime_count=self.__prime_count)
+            else:
+                key = self.__queue.get(timeout=timeout)
+
+        with self.__lock:
+            self.__stats["keys_served"] += 1
+        return key
+
+    def metrics(self):
+        """ KeyPool Method: metrics (public)
+            Parameters: None
+            Returns: dict containing the pool depth and capacity, the
+                     number of keys generated and served, the number of
+                     get calls that found the pool empty, the mean key
+                     generation time in seconds and the refill rate in
+                     keys per second since start
+        """
+        with self.__lock:
+            stats = dict(self.__stats)
+        started_at = stats.pop("started_at")
+        generation_seconds = stats.pop("generation_seconds")
+        generated = stats["keys_generated"]
+
+        stats["depth"] = self.__queue.qsize()
+        stats["capacity"] = self.__capacity
+        stats["mean_generation_seconds"] = \
+            generation_seconds / generated if generated else 0.0
+        if started_at is None:
+            stats["refill_rate"] = 0.0
+        else:
+            stats["refill_rate"] = \
+                generated / (time.perf_counter() - started_at)
+        return stats
+
+    def __refill(self):
+        """ KeyPool Method: __refill (private)
+            Parameters: None
+            Returns: None
+            Notes: Runs on the refill thread until stop is called. Each key
+                   is built from primes found in parallel, then held until
+                   the pool has room for it.
+        """
+        sizes = Keygen.RSAKey.prime_sizes(self.__key_size, self.__prime_count)
+        while not self.__stop_event.is_set():
+            start_time = time.perf_counter()
+            try:
+                futures = [self.__executor.submit(
+                    Keygen.RSAKey.generate_prime, self.__key_size,
+                    prime_bits, self.__prime_count) for prime_bits in sizes]
+                primes = [future.result() for future in futures]
+                for index in range(1, len(primes)):
+                    while primes[index] in primes[:index]:
+                        primes[index] = Keygen.RSAKey.generate_prime(
+                            self.__key_size, sizes[index],
+                            self.__prime_count)
+            except (concurrent.futures.CancelledError, RuntimeError):
+                return  # executor was shut down by stop.
+            key = Keygen.RSAKey(self.__key_size, primes=tuple(primes),
+                                export=False)
+
+            with self.__lock:
+                self.__stats["keys_generated"] += 1
+                self.__stats["generation_seconds"] += \
+                    time.perf_counter() - start_time
+
+            while not self.__stop_event.is_set():
+                try:
+                    self.__queue.put(key, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
@@ -0,0 +1,243 @@
+""" CS5001-5003, Spring 2022
+    Final Project (keyring module)
+    Norrec Nieh
+"""
+
+import Keygen
+import collections
+import hashlib
+import os
+import threading
+
+DEFAULT_CAPACITY = 32  # keys held before the least recently used is evicted
+
+
+class Keyring:
+    """ Class: Keyring
+        Attributes: __capacity (int)
+                    __entries (OrderedDict of fingerprint (str) -> entry
+                               (dict), least recently used first)
+                    __paths (dict of key file path (str) ->
+                             (file stamp (tuple), fingerprint (str)))
+                    __lock (threading.Lock)
+        Notes: In-memory cache of parsed keys, so key files are parsed once
+               rather than per call. Each entry is a dict containing
+               ["fingerprint"] (str), ["n"], ["e"] and ["byte_length"]
+               (ints), and ["private_key"] (dict as used by
+               decrypt.decrypt_int, or None for public keys).
+               A cached path is re-parsed when its file's mtime or size
+               changes.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        """ Method: __init__ (constructor)
+            Parameter: capacity (int)
+            Returns: None
+        """
+        self.__capacity = capacity
+        self.__entries = collections.OrderedDict()
+        self.__paths = {}
+        self.__lock = threading.Lock()
+
+    def load_public_key(self, path=Keygen.PUBLIC_KEY_PATH):
+        """ Keyring Method: load_public_key (public)
+            Parameter: path (str)
+            Returns: entry for the public key in path (dict)
+            Notes: Raises OSError if the file cannot be read, and
+                   ValueError if it cannot be parsed.
+        """
+        entry = self.__lookup(path)
+        if entry is not None and entry["e"] is not None:
+            return entry
+
+        stamp = file_stamp(path)
+        n, e = read_public_key(path)
+        return self.__store(path, stamp, n, e, None)
+
+    def load_private_key(self, path=Keygen.PRIVATE_KEY_PATH,
+                         public_key_path=Keygen.PUBLIC_KEY_PATH):
+        """ Keyring Method: load_private_key (public)
+            Parameters: path            (str)
+                        public_key_path (str)
+            Returns: entry for the private key in path (dict)
+            Notes: n is recovered as the product of the primes when the
+                   file holds the CRT parameters. public_key_path is only
+                   read for legacy key files that hold d alone.
+        """
+        entry = self.__lookup(path)
+        if entry is not None and entry["private_key"] is not None:
+            return entry
+
+        stamp = file_stamp(path)
+        private_key = read_private_key(path)
+        if "q_inv" in private_key:
+            n = private_key["p"] * private_key["q"]
+            for r, d_r, t in private_key["other_primes"]:
+                n *= r
+            e = None
+        else:
+            public_entry = self.load_public_key(public_key_path)
+            n, e = public_entry["n"], public_entry["e"]
+        return self.__store(path, stamp, n, e, private_key)
+
+    def add(self, n, e, private_key=None):
+        """ Keyring Method: add (public)
+            Parameters: n, e        (ints)
+                        private_key (dict, or None)
+            Returns: entry for the key (dict)
+            Notes: Caches a key that is already in memory, such as one
+                   taken from a KeyPool.
+        """
+        return self.__store(None, None, n, e, private_key)
+
+    def get(self, fingerprint):
+        """ Keyring Method: get (public)
+            Parameter: fingerprint (str)
+            Returns: entry for the key (dict), or None if not cached
+        """
+        with self.__lock:
+            entry = self.__entries.get(fingerprint)
+            if entry is not None:
+                self.__entries.move_to_end(fingerprint)
+            return entry
+
+    def clear(self):
+        """ Keyring Method: clear (public)
+            Parameters: None
+            Returns: None
+        """
+        with self.__lock:
+            self.__entries.clear()
+            self.__paths.clear()
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def __lookup(self, path):
+        """ Keyring Method: __lookup (private)
+            Parameter: path (str)
+            Returns: cached entry for path (dict), or None if path is not
+                     cached or its file has changed since it was parsed
+        """
+        with self.__lock:
+            cached = self.__paths.get(path)
+        if cached is None:
+            return None
+        stamp, fingerprint = cached
+        try:
+            if file_stamp(path) != stamp:
+                return None
+        except OSError:
+            return None
+        return self.get(fingerprint)
+
+    def __store(self, path, stamp, n, e, private_key):
+        """ Keyring Method: __store (private)
+            Parameters: path, stamp (key file and its file_stamp, or None)
+                        n, e        (ints) (e may be None)
+                        private_key (dict, or None)
+            Returns: entry for the key (dict)
+            Notes: Merges with an existing entry for the same modulus, so
+                   the public and private halves of a key share an entry.
+                   Evicts the least recently used entries over capacity.
+        """
+        key_fingerprint = fingerprint(n)
+        with self.__lock:
+            entry = self.__entries.get(key_fingerprint)
+            if entry is None:
+                entry = {"fingerprint": key_fingerprint, "n": n, "e": e,
+                         "byte_length": (n.bit_length() + 7) // 8,
+                         "private_key": None}
+                self.__entries[key_fingerprint] = entry
+            if e is not None:
+                entry["e"] = e
+            if private_key is not None:
+                entry["private_key"] = private_key
+            self.__entries.move_to_end(key_fingerprint)
+            if path is not None:
+                self.__paths[path] = (stamp, key_fingerprint)
+
+            while len(self.__entries) > self.__capacity:
+                evicted = self.__entries.popitem(last=False)[0]
+                for cached_path in [cached_path for cached_path, cached
+                                    in self.__paths.items()
+                                    if cached[1] == evicted]:
+                    del self.__paths[cached_path]
+            return entry
+
+
+def fingerprint(n):
+    """ Function: fingerprint
+        Parameter: n (int)
+        Returns: hex SHA-256 digest of the big-endian modulus (str)
+    """
+    n_bytes = n.to_bytes((n.bit_length() + 7) // 8, byteorder='big')
+    return hashlib.sha256(n_bytes).hexdigest()
+
+
+def file_stamp(path):
+    """ Function: file_stamp
+        Parameter: path (str)
+        Returns: mtime in nanoseconds and size of the file (tuple)
+    """
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def read_public_key(path):
+    """ Function: read_public_key
+        Parameter: path (str)
+        Returns: n, e (ints)
+        Notes: Parses public_key.pem for the modulus (n) and encryption
+               exponent (e). Binary, armored and legacy files are read.
+    """
+    values = Keygen.RSAKey.read_key_file(path, Keygen.KEY_KIND_PUBLIC)
+    if len(values) != 2:
+        raise ValueError("public key must hold n and e")
+    n, e = values
+    return n, e
+
+
+def read_private_key(path):
+    """ Function: read_private_key
+        Parameter: path (str)
+        Returns: private_key (dict containing ["d"], and ["p"], ["q"],
+                 ["d_p"], ["d_q"], ["q_inv"] and ["other_primes"] (list of
+                 (r, d_r, t) tuples) if present in the file)
+        Notes: Parses private_key.pem for the decryption exponent (d) and
+               the CRT parameters. Legacy key files hold d only.
+    """
+    values = Keygen.RSAKey.read_key_file(path, Keygen.KEY_KIND_PRIVATE)
+    other_count, remainder = divmod(len(values) - 6, 3)
+    if len(values) != 1 and (len(values) < 6 or remainder != 0 or
+                             other_count > Keygen.MAX_PRIME_COUNT - 2):
+        raise ValueError("private key must hold d, and optionally "
+                         "p, q, d_p, d_q and q_inv, followed by r, d_r "
+                         "and t for each further prime")
+
+    key = {"d": values[0]}
+    # CRT parameters follow d.
+    if len(values) >= 6:
+        key["p"], key["q"], key["d_p"], key["d_q"], key["q_inv"] = \
+            values[1:6]
+        key["other_primes"] = [tuple(values[index:index + 3])
+                               for index in range(6, len(values), 3)]
+    return key
+
+
+def migrate_key_file(path, kind, binary=False):
+    """ Function: migrate_key_file
+        Parameters: path   (str)
+                    kind   (int) (Keygen.KEY_KIND_PUBLIC or
+                                  Keygen.KEY_KIND_PRIVATE)
+                    binary (bool)
+        Returns: None
+        Notes: Rewrites a key file of any readable format (including the
+               legacy b'...' format) in the armored or binary format.
+    """
+    values = Keygen.RSAKey.read_key_file(path, kind)
+    Keygen.RSAKey.write_key_file(path, kind, values, binary)
+
+
+# Shared by encrypt.get_public_key and decrypt.get_private_key.
+DEFAULT_KEYRING = Keyring()
@@ -0,0 +1,167 @@
+""" CS5001-5003, Spring 2022
+    Final Project (loadtest module)
+    Norrec Nieh
+"""
+
+import benchmark
+import daemon
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+OPERATIONS = ("encrypt", "decrypt", "sign", "verify")
+STARTUP_TIMEOUT = 120  # seconds to wait for a spawned daemon's socket
+
+
+def run_load(client, operation, requests, concurrency, payload_size):
+    """ Function: run_load
+        Parameters: client       (daemon.DaemonClient)
+                    operation    (str) (one of OPERATIONS)
+                    requests     (int) (sent in all)
+                    concurrency  (int) (threads sending at once)
+                    payload_size (int) (bytes per request)
+        Returns: dict containing ["requests"], ["errors"], ["seconds"],
+                 ["requests_per_second"] and ["p50_ms"], ["p95_ms"],
+                 ["p99_ms"], ["max_ms"] (latencies of successful requests)
+        Notes: decrypt and verify requests reuse one ciphertext or
+               signature made before the clock starts, so only the
+               operation under test is timed.
+    """
+    payload = os.urandom(payload_size)
+    if operation == "decrypt":
+        payload = client.encrypt(payload)
+    signature_bytes = client.sign(payload) if operation == "verify" else None
+
+    def send():
+        if operation == "verify":
+            return client.verify(payload, signature_bytes)
+        return client.request(operation, payload)
+
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    remaining = [requests]
+
+    def worker():
+        while True:
+            with lock:
+                if remaining[0] == 0:
+                    return
+                remaining[0] -= 1
+            start_time = time.perf_counter()
+            try:
+                send()
+                latency = time.perf_counter() - start_time
+                with lock:
+                    latencies.append(latency)
+            except (OSError, daemon.DaemonError) as error:
+                with lock:
+                    errors.append(error)
+
+    threads = [threading.Thread(target=worker) for index in range(concurrency)]
+    start_time = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - start_time
+
+    result = {"requests": requests, "errors": len(errors),
+              "seconds": seconds,
+              "requests_per_second": len(latencies) / seconds
+              if seconds else 0.0}
+    if latencies:
+        for name, fraction in (("p50_ms", 0.50), ("p95_ms", 0.95),
+                               ("p99_ms", 0.99)):
+            result[name] = benchmark.percentile(latencies, fraction) * 1000
+        result["max_ms"] = max(latencies) * 1000
+        result["mean_ms"] = statistics.mean(latencies) * 1000
+    return result
+
+
+def spawn_daemon(socket_path, key_size, workers):
+    """ Function: spawn_daemon
+        Parameters: socket_path (str)
+                    key_size    (int) (key generated for the run)
+                    workers     (int, or None)
+        Returns: the daemon process (subprocess.Popen), or None if its
+                 socket did not appear within STARTUP_TIMEOUT seconds
+    """
+    command = [sys.executable, daemon.__file__, "--socket", socket_path,
+               "--generate", str(key_size)]
+    if workers is not None:
+        command += ["--workers", str(workers)]
+    process = subprocess.Popen(command)
+    client = daemon.DaemonClient(socket_path, 1)
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline and process.poll() is None:
+        try:
+            client.ping()
+            client.close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    process.wait()
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Load-test a running daemon and report requests per "
+                    "second and latency percentiles.")
+    parser.add_argument("--socket", default=daemon.SOCKET_PATH)
+    parser.add_argument("--operation", choices=OPERATIONS, default="encrypt")
+    parser.add_argument("-n", "--requests", type=int, default=1000)
+    parser.add_argument("-c", "--concurrency", type=int, default=8)
+    parser.add_argument("--size", type=int, default=256,
+                        help="payload bytes per request")
+    parser.add_argument("--spawn", type=int, default=None,
+                        metavar="KEY_SIZE",
+                        help="start a daemon with a new key of this size "
+                             "for the run, and stop it afterwards")
+    parser.add_argument("-w", "--workers", type=int, default=None,
+                        help="processes of a spawned daemon")
+    args = parser.parse_args()
+
+    process = None
+    if args.spawn is not None:
+        process = spawn_daemon(args.socket, args.spawn, args.workers)
+        if process is None:
+            print("The daemon did not start.")
+            sys.exit(1)
+
+    client = daemon.DaemonClient(args.socket, args.concurrency)
+    try:
+        result = run_load(client, args.operation, args.requests,
+                          args.concurrency, args.size)
+    except (OSError, daemon.DaemonError) as error:
+        print("Could not reach the daemon on ", args.socket, ": ", error,
+              sep="")
+        sys.exit(1)
+    finally:
+        client.close()
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    print(args.operation, ": ", args.requests, " requests of ", args.size,
+          " bytes, ", args.concurrency, " at a time", sep="")
+    print("  ", format(result["requests_per_second"], ".1f"),
+          " requests/s over ", format(result["seconds"], ".2f"), " s, ",
+          result["errors"], " errors", sep="")
+    if "p50_ms" in result:
+        print("  latency p50 ", format(result["p50_ms"], ".2f"), " ms, p95 ",
+              format(result["p95_ms"], ".2f"), " ms, p99 ",
+              format(result["p99_ms"], ".2f"), " ms, max ",
+              format(result["max_ms"], ".2f"), " ms", sep="")
+    if result["errors"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+""" CS5001-5003, Spring 2022
+    Final Project (metrics module)
+    Norrec Nieh
+"""
+
+import cProfile
+import contextlib
+import json
+import pstats
+import threading
+import time
+import tracemalloc
+
+# Counters and timers are only recorded once enable() is called, so the
+# instrumented hot paths cost one flag check when metrics are off.
+ENABLED = False
+
+PROFILE_LINES = 20  # functions listed in the cProfile summary
+TRACEMALLOC_LINES = 10  # allocation sites listed in the tracemalloc summary
+
+_counters = {}
+_timers = {}
+_lock = threading.Lock()
+_null_timer = contextlib.nullcontext()
+
+
+class _Timer:
+    """ Class: _Timer (private)
+        Attributes: name (str)
+                    start_time (float)
+        Notes: Context manager adding the time spent in its block to the
+               timer called name.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.start_time = 0.0
+
+    def __enter__(self):
+        self.start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        add_time(self.name, time.perf_counter() - self.start_time)
+
+
+def enable():
+    """ Function: enable
+        Parameters: None
+        Returns: None
+    """
+    global ENABLED
+    ENABLED = True
+
+
+def disable():
+    """ Function: disable
+        Parameters: None
+        Returns: None
+        Notes: Values recorded so far are kept until reset is called.
+    """
+    global ENABLED
+    ENABLED = False
+
+
+def reset():
+    """ Function: reset
+        Parameters: None
+        Returns: None
+    """
+    with _lock:
+        _counters.clear()
+        _timers.clear()
+
+
+def count(name, amount=1):
+    """ Function: count
+        Parameters: name   (str)
+                    amount (int)
+        Returns: None
+        Notes: Adds amount to the counter called name, if enabled.
+    """
+    if ENABLED:
+        with _lock:
+            _counters[name] = _counters.get(name, 0) + amount
+
+
+def add_time(name, seconds):
+    """ Function: add_time
+        Parameters: name    (str)
+                    seconds (float)
+        Returns: None
+        Notes: Adds seconds to the timer called name, if enabled.
+    """
+    if ENABLED:
+        with _lock:
+            _timers[name] = _timers.get(name, 0.0) + seconds
+
+
+def timer(name):
+    """ Function: timer
+        Parameter: name (str)
+        Returns: context manager timing its block into the timer called
+                 name, or a shared no-op context manager if not enabled
+    """
+    if ENABLED:
+        return _Timer(name)
+    return _null_timer
+
+
+def snapshot():
+    """ Function: snapshot
+        Parameters: None
+        Returns: dict containing ["counters"] (dict of name -> int) and
+                 ["timers"] (dict of name -> seconds)
+    """
+    with _lock:
+        return {"counters": dict(_counters), "timers": dict(_timers)}
+
+
+def to_json():
+    """ Function: to_json
+        Parameters: None
+        Returns: snapshot as a JSON string (str)
+    """
+    return json.dumps(snapshot(), indent=2, sort_keys=True)
+
+
+def profile(function, *args):
+    """ Function: profile
+        Parameters: function (function)
+                    args     (arguments passed to function)
+        Returns: the return value of function
+        Notes: Runs function with metrics enabled, under cProfile and
+               tracemalloc, then prints the functions with the most
+               cumulative time, the peak traced memory and its largest
+               allocation sites, and the metrics snapshot.
+    """
+    enable()
+    profiler = cProfile.Profile()
+    tracemalloc.start()
+    try:
+        result = profiler.runcall(function, *args)
+        memory_snapshot = tracemalloc.take_snapshot()
+        peak_memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+        disable()
+
+    print("\n----- cProfile (cumulative time) -----")
+    pstats.Stats(profiler).sort_stats("cumulative").print_stats(PROFILE_LINES)
+
+    print("----- tracemalloc -----")
+    print("Peak traced memory: ", format(peak_memory / 1024, ".1f"), " KiB",
+          sep="")
+    for statistic in memory_snapshot.statistics("lineno")[:TRACEMALLOC_LINES]:
+        print(statistic)
+
+    print("\n----- metrics -----")
+    print(to_json())
+    return result
@@ -0,0 +1,362 @@
+""" CS5001-5003, Spring 2022
+    Final Project (modexp module)
+    Norrec Nieh
+"""
+
+import Keygen
+import metrics
+import secrets
+import time
+
+try:
+    import gmpy2
+except ImportError:  # optional; see backends.
+    gmpy2 = None
+
+ENGINE_BINARY = "binary"  # RSAKey.exp_mod_iter, one bit at a time
+ENGINE_WINDOW = "window"  # sliding-window exponentiation
+ENGINE_MONTGOMERY = "montgomery"  # sliding window in Montgomery form
+ENGINE_BUILTIN = "builtin"  # Python's pow
+ENGINE_GMPY2 = "gmpy2"  # gmpy2.powmod, when installed
+ENGINES = (ENGINE_BINARY, ENGINE_WINDOW, ENGINE_MONTGOMERY, ENGINE_BUILTIN)
+
+# Engine used when SELECTION is empty. GMP is faster than pow at every
+# size.
+DEFAULT_ENGINE = ENGINE_BUILTIN
+if gmpy2 is not None:
+    ENGINES += (ENGINE_GMPY2,)
+    DEFAULT_ENGINE = ENGINE_GMPY2
+
+# Fastest engine by modulus size, as (largest bit length, engine) pairs in
+# increasing order, or empty to use DEFAULT_ENGINE at every size.
+# benchmark() puts pow level with the best pure-Python engine from 512 to
+# 4096 bits: window and Montgomery come within a few percent of it at 2048
+# and 4096 bits, ahead on some runs and behind on others, and lose below
+# that. The table is therefore empty, and every exponentiation goes
+# straight to DEFAULT_ENGINE; calibrate() fills it from a benchmark of this
+# machine.
+SELECTION = []
+
+CONTEXT_CACHE_SIZE = 64  # moduli whose precomputation is kept
+
+_contexts = {}
+
+
+class ModExpContext:
+    """ Class: ModExpContext
+        Attributes: n (int) (modulus)
+                    bits (int) (bit length of n)
+                    engine (str) (engine selected for this size of n)
+                    r_bits (int) (Montgomery R = 2^r_bits, 0 if n is even)
+                    n_prime (int) (-n^-1 mod R)
+                    r_squared (int) (R^2 mod n)
+        Notes: Precomputation reused by every exponentiation under the same
+               modulus, such as the Montgomery constants of n. Contexts are
+               cached by get_context, so one is built per key rather than
+               per call.
+    """
+
+    def __init__(self, n, engine=None):
+        """ Method: __init__ (constructor)
+            Parameters: n      (int)
+                        engine (str) (one of ENGINES, or None to select by
+                                      the size of n)
+            Returns: None
+        """
+        self.n = n
+        self.bits = n.bit_length()
+        self.engine = engine if engine is not None else select_engine(n)
+
+        # Montgomery form needs an odd modulus; every RSA modulus and prime
+        # is odd, so this only matters for generic callers.
+        self.r_bits = 0
+        self.n_prime = 0
+        self.r_squared = 0
+        if n % 2 == 1 and n > 1:
+            self.r_bits = self.bits
+            r = 1 << self.r_bits
+            self.n_prime = -pow(n, -1, r) % r
+            self.r_squared = (r * r) % n
+
+    def exp(self, x, y):
+        """ ModExpContext Method: exp (public)
+            Parameters: x: base     (int)
+                        y: exponent (int)
+            Returns: x^y mod n      (int)
+        """
+        return exp_with(self.engine, x, y, self)
+
+    def exp_window(self, x, y):
+        """ ModExpContext Method: exp_window (public)
+            Parameters: x: base     (int)
+                        y: exponent (int)
+            Returns: x^y mod n      (int)
+            Notes: Left-to-right sliding window. Odd powers x, x^3, ...,
+                   x^(2^k - 1) are precomputed, and each run of up to k
+                   exponent bits ending in a 1 costs one multiplication.
+        """
+        n = self.n
+        metrics.count("modexp.calls." + ENGINE_WINDOW)
+        if y == Keygen.ENCRYPTION_EXPONENT:
+            return exp_65537(x, n)
+        return _sliding_window(x % n, y, lambda a, b: a * b % n, 1 % n)
+
+    def exp_montgomery(self, x, y):
+        """ ModExpContext Method: exp_montgomery (public)
+            Parameters: x: base     (int)
+                        y: exponent (int)
+            Returns: x^y mod n      (int)
+            Notes: Sliding window with every product reduced by Montgomery
+                   reduction (shifts and masks) rather than a division by
+                   n. Falls back to exp_window for an even modulus.
+        """
+        if self.r_bits == 0:
+            return self.exp_window(x, y)
+        metrics.count("modexp.calls." + ENGINE_MONTGOMERY)
+        metrics.count("modexp.modmuls", 3)  # into and out of the form
+        n = self.n
+        r_bits = self.r_bits
+        mask = (1 << r_bits) - 1
+        n_prime = self.n_prime
+
+        def multiply(a, b):
+            t = a * b
+            m = ((t & mask) * n_prime) & mask
+            u = (t + m * n) >> r_bits
+            return u - n if u >= n else u
+
+        x_mont = multiply(x % n, self.r_squared)  # x * R mod n
+        one_mont = multiply(1, self.r_squared)  # R mod n
+        result = _sliding_window(x_mont, y, multiply, one_mont)
+        return multiply(result, 1)  # back out of Montgomery form
+
+
+def exp_mod(x, y, n):
+    """ Function: exp_mod
+        Parameters: x: base     (int)
+                    y: exponent (int)
+                    n: modulus  (int)
+        Returns: x^y mod n      (int)
+        Notes: Uses the engine selected for the size of n, with the cached
+               context for n. Builtin pow and gmpy2 need no context, so
+               none is built for them; Miller-Rabin candidates would
+               otherwise crowd the key moduli out of the cache.
+    """
+    if not SELECTION:
+        return _pow(DEFAULT_ENGINE, x, y, n)
+    engine = select_engine(n)
+    if engine == ENGINE_BUILTIN or engine == ENGINE_GMPY2:
+        return _pow(engine, x, y, n)
+    return get_context(n).exp(x, y)
+
+
+def exp_function(n):
+    """ Function: exp_function
+        Parameter: n: modulus (int)
+        Returns: function of x and y returning x^y mod n
+        Notes: Resolves the engine and context for n once, for callers that
+               run many exponentiations under the same modulus.
+    """
+    engine = select_engine(n)
+    if engine == ENGINE_BUILTIN or engine == ENGINE_GMPY2:
+        return lambda x, y: _pow(engine, x, y, n)
+    return get_context(n).exp
+
+
+def exp_with(engine, x, y, context):
+    """ Function: exp_with
+        Parameters: engine  (str) (one of ENGINES)
+                    x, y    (ints)
+                    context (ModExpContext)
+        Returns: x^y mod n (int)
+    """
+    if engine == ENGINE_BUILTIN or engine == ENGINE_GMPY2:
+        return _pow(engine, x, y, context.n)
+    if engine == ENGINE_MONTGOMERY:
+        return context.exp_montgomery(x, y)
+    if engine == ENGINE_WINDOW:
+        return context.exp_window(x, y)
+    return Keygen.RSAKey.exp_mod_iter(x, y, context.n)
+
+
+def exp_65537(x, n):
+    """ Function: exp_65537
+        Parameters: x: base    (int)
+                    n: modulus (int)
+        Returns: x^65537 mod n (int)
+        Notes: Fixed addition chain for ENCRYPTION_EXPONENT = 2^16 + 1:
+               sixteen squarings and one multiplication.
+    """
+    metrics.count("modexp.modmuls", 17)
+    x %= n
+    result = x
+    for square in range(16):
+        result = result * result % n
+    return result * x % n
+
+
+def get_context(n):
+    """ Function: get_context
+        Parameter: n (int)
+        Returns: the cached ModExpContext for n
+        Notes: Least recently used cache: a context moves to the end of
+               the dict each time it is used, and the one at the front is
+               dropped once CONTEXT_CACHE_SIZE moduli are cached.
+    """
+    context = _contexts.pop(n, None)
+    if context is None:
+        if len(_contexts) >= CONTEXT_CACHE_SIZE:
+            del _contexts[next(iter(_contexts))]
+        context = ModExpContext(n)
+    _contexts[n] = context
+    return context
+
+
+def select_engine(n):
+    """ Function: select_engine
+        Parameter: n (int)
+        Returns: the engine in SELECTION for the size of n, or
+                 DEFAULT_ENGINE if SELECTION is empty (str)
+    """
+    if not SELECTION:
+        return DEFAULT_ENGINE
+    bits = n.bit_length()
+    for largest_bits, engine in SELECTION:
+        if bits <= largest_bits:
+            return engine
+    return SELECTION[-1][1]
+
+
+def window_size(exponent_bits):
+    """ Function: window_size
+        Parameter: exponent_bits (int)
+        Returns: sliding-window width k for an exponent of that size (int)
+        Notes: Balances the 2^(k-1) precomputed powers against the number
+               of multiplications saved.
+    """
+    if exponent_bits < 24:
+        return 1
+    if exponent_bits < 80:
+        return 3
+    if exponent_bits < 240:
+        return 4
+    if exponent_bits < 672:
+        return 5
+    return 6
+
+
+def benchmark(bit_sizes=(512, 1024, 2048, 4096), repeats=3):
+    """ Function: benchmark
+        Parameters: bit_sizes (tuple of ints) (modulus sizes)
+                    repeats   (int) (exponentiations timed per engine)
+        Returns: dict of bit size -> dict of engine -> mean seconds
+        Notes: Times a full-size exponent under an odd modulus of each
+               size, for every engine, on the same operands.
+    """
+    secrets_rand = secrets.SystemRandom()
+    results = {}
+    for bits in bit_sizes:
+        n = secrets_rand.getrandbits(bits) | (1 << (bits - 1)) | 1
+        x = secrets_rand.randrange(2, n)
+        y = secrets_rand.getrandbits(bits) | (1 << (bits - 1))
+        expected = pow(x, y, n)
+        results[bits] = {}
+        for engine in ENGINES:
+            context = ModExpContext(n, engine)
+            start_time = time.perf_counter()
+            for repeat in range(repeats):
+                if exp_with(engine, x, y, context) != expected:
+                    raise ArithmeticError(engine + " engine is incorrect")
+            results[bits][engine] = \
+                (time.perf_counter() - start_time) / repeats
+    return results
+
+
+def calibrate(bit_sizes=(512, 1024, 2048, 4096), repeats=3):
+    """ Function: calibrate
+        Parameters: bit_sizes (tuple of ints)
+                    repeats   (int)
+        Returns: the new SELECTION (list of tuples)
+        Notes: Runs benchmark and selects the fastest engine for each size.
+               Cached contexts are cleared so they pick up the change.
+    """
+    results = benchmark(bit_sizes, repeats)
+    SELECTION[:] = [(bits, min(results[bits], key=results[bits].get))
+                    for bits in sorted(results)]
+    _contexts.clear()
+    return SELECTION
+
+
+def binary_modmuls(y):
+    """ Function: binary_modmuls
+        Parameter: y: exponent (int)
+        Returns: modular multiplications of square-and-multiply for y (int)
+        Notes: One squaring per bit of y and one multiplication per set
+               bit, as in RSAKey.exp_mod_iter.
+    """
+    return y.bit_length() + bin(y).count("1")
+
+
+def _pow(engine, x, y, n):
+    """ Function: _pow (private)
+        Parameters: engine (str) (ENGINE_BUILTIN or ENGINE_GMPY2)
+                    x, y, n (ints)
+        Returns: x^y mod n (int)
+        Notes: pow and gmpy2 do not expose their multiplications, so the
+               metrics count the ones square-and-multiply would need.
+    """
+    if metrics.ENABLED:
+        metrics.count("modexp.calls." + engine)
+        metrics.count("modexp.modmuls", binary_modmuls(y))
+    if engine == ENGINE_GMPY2:
+        return int(gmpy2.powmod(x, y, n))
+    return pow(x, y, n)
+
+
+def _sliding_window(x, y, multiply, one):
+    """ Function: _sliding_window (private)
+        Parameters: x        (int) (base, already reduced)
+                    y        (int) (exponent)
+                    multiply (function of two ints) (modular product)
+                    one      (int) (1 in the representation of multiply)
+        Returns: x^y in the representation of multiply (int)
+    """
+    if y == 0:
+        return one
+    k = window_size(y.bit_length())
+
+    # odd powers x^1, x^3, ..., x^(2^k - 1)
+    x_squared = multiply(x, x)
+    odd_powers = [x]
+    for index in range(1, 1 << (k - 1)):
+        odd_powers.append(multiply(odd_powers[-1], x_squared))
+
+    bits = bin(y)[2:]
+    result = one
+    index = 0
+    windows = 0
+    while index < len(bits):
+        if bits[index] == "0":
+            result = multiply(result, result)
+            index += 1
+        else:
+            # longest window of at most k bits that ends in a 1.
+            end = min(index + k, len(bits))
+            while bits[end - 1] == "0":
+                end -= 1
+            for square in range(end - index):
+                result = multiply(result, result)
+            result = multiply(result, odd_powers[int(bits[index:end], 2) >> 1])
+            windows += 1
+            index = end
+    # one squaring per bit, one multiplication per window, and the
+    # precomputed odd powers.
+    metrics.count("modexp.modmuls", len(bits) + windows + (1 << (k - 1)))
+    return result
+
+
+if __name__ == "__main__":
+    for size, timings in benchmark().items():
+        print(size, "bits:", ", ".join(
+            engine + " " + format(seconds * 1000, ".2f") + " ms"
+            for engine, seconds in timings.items()))
@@ -0,0 +1,141 @@
+""" CS5001-5003, Spring 2022
+    Final Project (parallel module)
+    Norrec Nieh
+"""
+
+import Keygen
+import decrypt
+import signature
+import collections
+import concurrent.futures
+import os
+
+DEFAULT_CHUNK_SIZE = 16  # blocks sent to a worker per task
+
+# Key shipped to each worker process once, by _init_worker.
+_worker_key = None
+
+
+def map_blocks(function, key, values, workers=None, chunk_size=None):
+    """ Function: map_blocks (generator)
+        Parameters: function   (_encrypt_chunk, _decrypt_chunk or
+                                _verify_chunk)
+                    key        (tuple) (passed to each worker once)
+                    values     (iterable)
+                    workers    (int) (defaults to the number of cores)
+                    chunk_size (int) (blocks per task, defaults to
+                                      DEFAULT_CHUNK_SIZE)
+        Yields: function applied to each value, in input order
+        Notes: Spreads the blocks across a process pool, since the
+               exponentiations hold the GIL. Only workers * 2 tasks are in
+               flight at once, so memory stays flat for long inputs.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if chunk_size is None:
+        chunk_size = DEFAULT_CHUNK_SIZE
+
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker,
+            initargs=(key,)) as executor:
+        pending = collections.deque()
+        for chunk in _chunks(values, chunk_size):
+            pending.append(executor.submit(function, chunk))
+            # waits on the oldest task first, which keeps the output order.
+            if len(pending) >= workers * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def encrypt_ints(values, n, e, workers=None, chunk_size=None):
+    """ Function: encrypt_ints (generator)
+        Parameters: values     (iterable of ints)
+                    n, e       (ints)
+                    workers    (int)
+                    chunk_size (int)
+        Yields: ciphertext of each value, in input order (int)
+    """
+    return map_blocks(_encrypt_chunk, (n, e), values, workers, chunk_size)
+
+
+def decrypt_ints(ciphertexts, n, private_key, workers=None,
+                 chunk_size=None):
+    """ Function: decrypt_ints (generator)
+        Parameters: ciphertexts (iterable of ints)
+                    n           (int)
+                    private_key (dict, as returned by get_private_key)
+                    workers     (int)
+                    chunk_size  (int)
+        Yields: plaintext of each ciphertext, in input order (int)
+    """
+    return map_blocks(_decrypt_chunk, (n, private_key), ciphertexts,
+                      workers, chunk_size)
+
+
+def verify_signatures(pairs, n, e, workers=None, chunk_size=None):
+    """ Function: verify_signatures (generator)
+        Parameters: pairs      (iterable of (digest, signature) tuples of
+                                bytes)
+                    n, e       (ints)
+                    workers    (int)
+                    chunk_size (int)
+        Yields: whether each signature is valid, in input order (bool)
+    """
+    return map_blocks(_verify_chunk, (n, e), pairs, workers, chunk_size)
+
+
+def _chunks(values, chunk_size):
+    """ Function: _chunks (generator, private)
+        Parameters: values     (iterable)
+                    chunk_size (int)
+        Yields: lists of at most chunk_size values
+    """
+    chunk = []
+    for value in values:
+        chunk.append(value)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _init_worker(key):
+    """ Function: _init_worker (private)
+        Parameter: key (tuple)
+        Returns: None
+        Notes: Runs once in each worker process, so the key is not pickled
+               with every task.
+    """
+    global _worker_key
+    _worker_key = key
+
+
+def _encrypt_chunk(chunk):
+    """ Function: _encrypt_chunk (private)
+        Parameter: chunk (list of ints)
+        Returns: list of ciphertexts (ints)
+    """
+    n, e = _worker_key
+    return [Keygen.RSAKey.exp_mod(value, e, n) for value in chunk]
+
+
+def _decrypt_chunk(chunk):
+    """ Function: _decrypt_chunk (private)
+        Parameter: chunk (list of ints)
+        Returns: list of plaintexts (ints)
+    """
+    n, private_key = _worker_key
+    decryptor = decrypt.make_decryptor(n, private_key)
+    return [decryptor(ciphertext) for ciphertext in chunk]
+
+
+def _verify_chunk(chunk):
+    """ Function: _verify_chunk (private)
+        Parameter: chunk (list of (digest, signature) tuples)
+        Returns: list of results (bools)
+    """
+    verifier = signature.make_verifier(*_worker_key)
+    return [verifier(digest, signature_bytes)
+            for digest, signature_bytes in chunk]
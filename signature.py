@@ -0,0 +1,277 @@
+""" CS5001-5003, Spring 2022
+    Final Project (signature module)
+    Norrec Nieh
+"""
+
+import Keygen
+import decrypt
+import encrypt
+import modexp
+import parallel
+import argparse
+import hashlib
+import sys
+
+SIGNATURE_SUFFIX = ".sig"  # appended to the signed file's path
+SIGNATURE_LABEL = "RSA SIGNATURE"
+READ_CHUNK_SIZE = 65536  # bytes hashed per read when signing files
+
+# DER encoding of the SHA-256 AlgorithmIdentifier and the start of the
+# digest OCTET STRING, which precede the digest in EMSA-PKCS1-v1_5.
+SHA256_DIGEST_INFO = bytes.fromhex("3031300d060960864801650304020105000420")
+DIGEST_SIZE = hashlib.sha256().digest_size
+
+
+def sign(data, private_key_path=Keygen.PRIVATE_KEY_PATH,
+         public_key_path=Keygen.PUBLIC_KEY_PATH, key=None):
+    """ Function: sign
+        Parameters: data             (bytes, or str encoded as utf-8)
+                    private_key_path (str)
+                    public_key_path  (str)
+                    key              ((n, private_key) tuple, or None to
+                                      read the key files)
+        Returns: signature, the byte length of n (bytes), or None on
+                 failure
+        Notes: RSASSA-PKCS1-v1_5 with SHA-256 (RFC 8017, 8.2). The digest
+               is signed with the CRT fast path of decrypt.decrypt_int.
+    """
+    if isinstance(data, str):
+        data = data.encode()
+    return sign_digest(hashlib.sha256(data).digest(), private_key_path,
+                       public_key_path, key)
+
+
+def sign_digest(digest, private_key_path=Keygen.PRIVATE_KEY_PATH,
+                public_key_path=Keygen.PUBLIC_KEY_PATH, key=None):
+    """ Function: sign_digest
+        Parameters: digest           (bytes) (SHA-256 digest)
+                    private_key_path (str)
+                    public_key_path  (str)
+                    key              ((n, private_key) tuple, or None)
+        Returns: signature (bytes), or None on failure
+        Notes: The signature is checked with the public exponent before it
+               is returned. A fault in one half of a CRT exponentiation
+               would otherwise give out a signature from which n can be
+               factored.
+    """
+    if key is None:
+        entry = decrypt.get_key_pair(private_key_path, public_key_path)
+        if entry is None:
+            return None
+        key = entry["n"], entry["private_key"]
+    n, private_key = key
+    length = (n.bit_length() + 7) // 8
+
+    try:
+        encoded = encode_digest(digest, length)
+    except ValueError:
+        print("The key is too small to sign a SHA-256 digest.")
+        return None
+    signature = decrypt.decrypt_int(encoded, n, private_key)
+    if Keygen.RSAKey.exp_mod(signature, Keygen.ENCRYPTION_EXPONENT, n) != \
+            encoded:
+        print("Signature failed its check; it was not released.")
+        return None
+    return signature.to_bytes(length, byteorder='big')
+
+
+def verify(data, signature, public_key=Keygen.PUBLIC_KEY_PATH):
+    """ Function: verify
+        Parameters: data       (bytes, or str encoded as utf-8)
+                    signature  (bytes) (as returned by sign)
+                    public_key (as for encrypt.encrypt, but not None)
+        Returns: True/False (bool)
+    """
+    public_key = encrypt.resolve_public_key(public_key)
+    if public_key is None:
+        return False  # key file could not be read
+    if isinstance(data, str):
+        data = data.encode()
+    verifier = make_verifier(*public_key)
+    return verifier(hashlib.sha256(data).digest(), signature)
+
+
+def verify_many(records, public_key=Keygen.PUBLIC_KEY_PATH, workers=1,
+                chunk_size=None):
+    """ Function: verify_many
+        Parameters: records    (iterable of (data, signature) tuples)
+                    public_key (as for encrypt.encrypt, but not None)
+                    workers    (int) (processes; 1 verifies in this one)
+                    chunk_size (int) (records per worker task, or None for
+                                      parallel.DEFAULT_CHUNK_SIZE)
+        Returns: result of each record, in input order (list of bools)
+        Notes: The key is resolved and the padding for its size built
+               once for the whole batch. Records are hashed here, so only
+               the 32-byte digests and the signatures go to the workers.
+               Each check is one exponentiation by e = 65537: seventeen
+               modular multiplications, against a full-size exponent for
+               signing.
+    """
+    public_key = encrypt.resolve_public_key(public_key)
+    if public_key is None:
+        return [False for record in records]
+    n, e = public_key
+    pairs = ((hashlib.sha256(data.encode() if isinstance(data, str)
+                             else data).digest(), signature)
+             for data, signature in records)
+    if workers <= 1:
+        verifier = make_verifier(n, e)
+        return [verifier(digest, signature) for digest, signature in pairs]
+    return list(parallel.verify_signatures(pairs, n, e, workers, chunk_size))
+
+
+def make_verifier(n, e):
+    """ Function: make_verifier
+        Parameters: n, e (ints)
+        Returns: function of a digest and a signature (bytes) returning
+                 True/False
+        Notes: Resolves the exponentiation engine for n and the padding
+               for its byte length once. A signature is valid when it has
+               exactly that length and its e-th power is the padded digest;
+               the comparison is made on ints, so the result never has to
+               be converted back to bytes.
+    """
+    length = (n.bit_length() + 7) // 8
+    exp = modexp.exp_function(n)
+    padding = encode_digest(bytes(DIGEST_SIZE), length)
+
+    def verifier(digest, signature):
+        if len(signature) != length or len(digest) != DIGEST_SIZE:
+            return False
+        value = int.from_bytes(signature, byteorder='big')
+        if value >= n:
+            return False
+        return exp(value, e) == padding | int.from_bytes(digest,
+                                                         byteorder='big')
+
+    return verifier
+
+
+def encode_digest(digest, length):
+    """ Function: encode_digest
+        Parameters: digest (bytes) (SHA-256 digest)
+                    length (int) (byte length of n)
+        Returns: EMSA-PKCS1-v1_5 encoding of digest, as an int
+        Notes: 0x00 0x01, then 0xff padding, then 0x00, SHA256_DIGEST_INFO
+               and the digest, filling length bytes. Raises ValueError if
+               length leaves fewer than 8 padding bytes.
+    """
+    digest_info = SHA256_DIGEST_INFO + digest
+    padding_length = length - len(digest_info) - 3
+    if padding_length < 8:
+        raise ValueError("modulus too short for the digest")
+    encoded = b"\x00\x01" + b"\xff" * padding_length + b"\x00" + digest_info
+    return int.from_bytes(encoded, byteorder='big')
+
+
+def sign_file(in_path, out_path=None, private_key_path=Keygen.PRIVATE_KEY_PATH,
+              public_key_path=Keygen.PUBLIC_KEY_PATH):
+    """ Function: sign_file
+        Parameters: in_path          (str)
+                    out_path         (str) (or None for in_path +
+                                            SIGNATURE_SUFFIX)
+                    private_key_path (str)
+                    public_key_path  (str)
+        Returns: True/False (bool)
+        Notes: The file is hashed READ_CHUNK_SIZE bytes at a time, and the
+               signature is written armored between banners.
+    """
+    if out_path is None:
+        out_path = in_path + SIGNATURE_SUFFIX
+    digest = file_digest(in_path)
+    if digest is None:
+        return False
+    signature = sign_digest(digest, private_key_path, public_key_path)
+    if signature is None:
+        return False
+
+    try:
+        with open(out_path, "w") as out_file:
+            out_file.write(Keygen.RSAKey.armor(signature, SIGNATURE_LABEL))
+        return True
+
+    except PermissionError:
+        print("Permission denied for ", out_path, ".", sep="")
+        return False
+
+    except IOError:
+        print("Error occurred while writing to ", out_path, ".", sep="")
+        return False
+
+
+def verify_file(in_path, signature_path=None,
+                public_key=Keygen.PUBLIC_KEY_PATH):
+    """ Function: verify_file
+        Parameters: in_path        (str)
+                    signature_path (str) (or None for in_path +
+                                          SIGNATURE_SUFFIX)
+                    public_key     (as for encrypt.encrypt, but not None)
+        Returns: True/False (bool)
+    """
+    if signature_path is None:
+        signature_path = in_path + SIGNATURE_SUFFIX
+    public_key = encrypt.resolve_public_key(public_key)
+    digest = file_digest(in_path)
+    if public_key is None or digest is None:
+        return False
+
+    try:
+        with open(signature_path) as signature_file:
+            signature = Keygen.RSAKey.dearmor(signature_file.read())
+    except FileNotFoundError:
+        print("File ", signature_path, " was not found.", sep="")
+        return False
+    except (IOError, ValueError):
+        print("Error occurred while reading ", signature_path, ".", sep="")
+        return False
+    return make_verifier(*public_key)(digest, signature)
+
+
+def file_digest(path):
+    """ Function: file_digest
+        Parameter: path (str)
+        Returns: SHA-256 digest of the file (bytes), or None if it could
+                 not be read
+    """
+    digest = hashlib.sha256()
+    try:
+        with open(path, "rb") as file_handle:
+            for chunk in iter(lambda: file_handle.read(READ_CHUNK_SIZE), b""):
+                digest.update(chunk)
+        return digest.digest()
+
+    except FileNotFoundError:
+        print("File ", path, " was not found.", sep="")
+
+    except PermissionError:
+        print("Permission denied for ", path, ".", sep="")
+
+    except IOError:
+        print("Error occurred while reading ", path, ".", sep="")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Sign files, or verify their signatures.")
+    parser.add_argument("operation", choices=("sign", "verify"))
+    parser.add_argument("files", nargs="+")
+    parser.add_argument("--public-key", default=Keygen.PUBLIC_KEY_PATH)
+    parser.add_argument("--private-key", default=Keygen.PRIVATE_KEY_PATH)
+    args = parser.parse_args()
+
+    failed = 0
+    for path in args.files:
+        if args.operation == "sign":
+            success = sign_file(path, None, args.private_key,
+                                args.public_key)
+            print("signed   " if success else "FAILED   ", path, sep="")
+        else:
+            success = verify_file(path, None, args.public_key)
+            print("valid    " if success else "INVALID  ", path, sep="")
+        failed += not success
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()